@@ -0,0 +1,87 @@
+"""
+Import-time benchmark for the svgtree CLI.
+
+Times `python -X importtime -c "import svg_tree.main"` (what every run pays before doing
+any work) in fresh interpreters, for the working tree and for any git revisions given,
+e.g. the last commit before the heavy dependencies were made lazy. Each revision's `src/`
+is exported with `git archive`, so all layouts run against the same installed packages.
+
+    python benchmarks/bench_import.py <baseline-rev> [-n 20]
+"""
+import io
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+HEAVY_MODULES = ['cairosvg', 'PIL', 'pygments', 'fontTools', 'svgwrite', 'requests']
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+def export_src(rev: str, dest: str) -> str:
+    """Extracts `src/` of git revision `rev` into `dest` and returns its path."""
+    archive = subprocess.run(['git', 'archive', '--format=tar', rev, 'src'], cwd=REPO_DIR, check=True, capture_output=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(dest)
+    return os.path.join(dest, 'src')
+
+def parse_importtime(stderr: str) -> Tuple[Optional[int], Dict[str, int]]:
+    """Cumulative microseconds of `svg_tree.main` and of every top-level package imported."""
+    main_us, packages = None, {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = [part.strip() for part in line[len('import time:'):].split('|')]
+        if not cumulative.isdigit():
+            continue
+        if name == 'svg_tree.main':
+            main_us = int(cumulative)
+        elif '.' not in name:
+            packages[name] = int(cumulative)
+    return main_us, packages
+
+def run_layout(src_dir: str, repeat: int) -> Tuple[List[int], Dict[str, int], str]:
+    env = dict(os.environ, PYTHONPATH=src_dir)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    times, heavy, error = [], {}, ''
+    # One untimed launch writes the bytecode caches, so every layout is measured warm
+    for i in range(repeat + 1):
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import svg_tree.main'], env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit status {proc.returncode}"
+            break
+        main_us, packages = parse_importtime(proc.stderr)
+        if i and main_us is not None:
+            times.append(main_us)
+            heavy = {m: packages[m] for m in HEAVY_MODULES if m in packages}
+    return times, heavy, error
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure svgtree CLI import time against earlier revisions.")
+    parser.add_argument("revisions", nargs="*", help="Git revisions to compare with the working tree (e.g. a baseline commit)")
+    parser.add_argument("-n", "--repeat", type=int, default=20, help="Interpreter launches per layout (default: 20)")
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix='svgtree-bench-import-')
+    try:
+        layouts = [(rev, export_src(rev, os.path.join(work, str(i)))) for i, rev in enumerate(args.revisions)]
+        layouts.append(('working tree', os.path.join(REPO_DIR, 'src')))
+
+        print(f"{'layout':<20} {'median':>9} {'min':>9}  heavy packages imported (cumulative)")
+        for name, src_dir in layouts:
+            times, heavy, error = run_layout(src_dir, args.repeat)
+            if not times:
+                print(f"{name:<20} {'failed':>9}  {error}")
+                continue
+            loaded = ", ".join(f"{m} {us / 1000:.1f}ms" for m, us in heavy.items()) or '-'
+            print(f"{name:<20} {statistics.median(times) / 1000:>7.1f}ms {min(times) / 1000:>7.1f}ms  {loaded}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Per-stage benchmark of the svgtree pipeline on a synthetic tree (see synth.py).
+
+Measures wall time, peak Python memory (tracemalloc) and output size of each stage:
+scan (build_tree), glyphs (cold glyph extraction), previews (preview pool), svg
+(generate_svg), html (generate_html) and png (export_png, skipped when no rasterizer
+works). Runs offline: config and caches live in a temp dir and the icon font is the
+installed one or a generated stand-in.
+
+    python benchmarks/bench_pipeline.py --width 6 --depth 3 --images 10 --save baseline.json
+    python benchmarks/bench_pipeline.py --width 6 --depth 3 --images 10 --compare baseline.json
+"""
+import argparse
+import json
+import os
+import pickle
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synth import SRC_DIR, add_tree_arguments, make_font, make_tree, tree_kwargs
+
+STAGES = ['scan', 'glyphs', 'previews', 'svg', 'html', 'png']
+# Differences below these are noise, whatever the tolerance
+MIN_WALL_DELTA = 0.005
+MIN_MEMORY_DELTA = 1024 * 1024
+MIN_SIZE_DELTA = 1024
+
+def measure(fn: Callable[[], Optional[int]], repeat: int) -> Optional[Dict[str, Any]]:
+    """Runs `fn` once under tracemalloc for its peak, then `repeat` times for timing."""
+    tracemalloc.start()
+    size = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    if size is None:
+        return None
+    walls, cpus = [], []
+    for _ in range(repeat):
+        wall, cpu = time.perf_counter(), time.process_time()
+        fn()
+        walls.append(time.perf_counter() - wall)
+        cpus.append(time.process_time() - cpu)
+    return {'wall': statistics.median(walls), 'cpu': statistics.median(cpus), 'peak': peak, 'size': size}
+
+def run(args: argparse.Namespace, work: str) -> Dict[str, Any]:
+    os.environ['XDG_CONFIG_HOME'] = os.path.join(work, 'config')
+    os.environ['XDG_CACHE_HOME'] = os.path.join(work, 'cache')
+    sys.path.insert(0, SRC_DIR)
+    from svg_tree.config import load_theme
+    from svg_tree.core import build_tree, flatten_tree
+    from svg_tree import icons
+    from svg_tree.icons import get_font_path, get_glyph_cache_path, load_glyph_paths
+    from svg_tree.pool import get_preview_pool
+    from svg_tree.render import generate_svg
+    from svg_tree.html import generate_html
+    from svg_tree.export import export_png
+
+    if args.font:
+        os.makedirs(os.path.dirname(get_font_path()), exist_ok=True)
+        shutil.copy(args.font, get_font_path())
+    else:
+        make_font(get_font_path())
+
+    root = os.path.join(work, 'tree')
+    tree = make_tree(root, **tree_kwargs(args))
+    print(f"Tree: {tree['dirs']} dirs, {tree['files']} files ({tree['images']} images), {tree['bytes'] / 1e6:.1f} MB")
+
+    theme = load_theme(None)
+    out = os.path.join(work, 'out')
+    os.makedirs(out)
+    state = {}
+
+    def scan():
+        state['nodes'] = build_tree(root, args.depth + 1, None)
+        return len(state['nodes'])
+
+    def glyphs():
+        if os.path.exists(get_glyph_cache_path()):
+            os.remove(get_glyph_cache_path())
+        icons._GLYPH_CACHE.clear()
+        return len(json.dumps(load_glyph_paths()))
+
+    def previews():
+        import pathspec
+        spec = pathspec.PathSpec.from_lines('gitwildmatch', [p.strip() for p in args.preview.split(",")])
+        tasks = [(n.index, n.path) for n in flatten_tree(state['nodes']) if not n.is_dir and spec.match_file(n.name)]
+        batch = get_preview_pool().schedule(tasks, 'svg', None, theme.get('preview'))
+        try:
+            return sum(len(pickle.dumps(batch.get(key))) for key, _ in tasks)
+        finally:
+            batch.close()
+
+    def svg():
+        generate_svg(root, os.path.join(out, 'tree.svg'), state['nodes'], theme, preview_patterns=args.preview)
+        return os.path.getsize(os.path.join(out, 'tree.svg'))
+
+    def html():
+        generate_html(root, os.path.join(out, 'tree.html'), state['nodes'], theme, preview_patterns=args.preview)
+        return os.path.getsize(os.path.join(out, 'tree.html'))
+
+    def png():
+        png_path = os.path.join(out, 'tree.png')
+        if os.path.exists(png_path):
+            os.remove(png_path)
+        export_png(os.path.join(out, 'tree.svg'), png_path, args.scale)
+        return os.path.getsize(png_path) if os.path.exists(png_path) else None
+
+    results = {}
+    for name, fn in zip(STAGES, [scan, glyphs, previews, svg, html, png]):
+        if name not in args.stages:
+            continue
+        results[name] = measure(fn, args.repeat)
+    get_preview_pool().shutdown()
+    return results
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> list:
+    regressions = []
+    for stage, res in results.items():
+        base = baseline.get(stage)
+        if not res or not base:
+            continue
+        for key, floor in (('wall', MIN_WALL_DELTA), ('peak', MIN_MEMORY_DELTA), ('size', MIN_SIZE_DELTA)):
+            if res[key] > base[key] * (1 + tolerance) and res[key] - base[key] > floor:
+                regressions.append(f"{stage} {key}: {base[key]:.6g} -> {res[key]:.6g} (+{(res[key] / base[key] - 1) * 100 if base[key] else float('inf'):.0f}%)")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the svgtree pipeline stage by stage on a synthetic tree.")
+    add_tree_arguments(parser)
+    parser.add_argument("-n", "--repeat", type=int, default=3, help="Timed runs per stage, the median is reported (default: 3)")
+    parser.add_argument("-p", "--preview", default="*.py, *.md, *.png, *.jpg", help="Preview patterns (default: '*.py, *.md, *.png, *.jpg')")
+    parser.add_argument("-s", "--scale", type=int, default=1, help="PNG scale factor (default: 1)")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma-separated stages to run (default: {','.join(STAGES)})")
+    parser.add_argument("--font", help="Icon font to use instead of a generated stand-in")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare with a JSON file written by --save and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown/growth over the baseline (default: 0.2)")
+    args = parser.parse_args()
+    args.stages = [s.strip() for s in args.stages.split(",")]
+
+    work = tempfile.mkdtemp(prefix='svgtree-bench-')
+    try:
+        results = run(args, work)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    print(f"{'stage':<10} {'wall':>10} {'cpu':>10} {'peak mem':>10} {'output':>12}")
+    for stage, res in results.items():
+        if res is None:
+            print(f"{stage:<10} {'skipped':>10}")
+            continue
+        print(f"{stage:<10} {res['wall'] * 1000:>8.1f}ms {res['cpu'] * 1000:>8.1f}ms {res['peak'] / 1e6:>8.1f}MB {res['size']:>12,}")
+
+    params = {k: v for k, v in vars(args).items() if k not in ('save', 'compare', 'tolerance', 'repeat', 'stages', 'font')}
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'params': params, 'results': results}, f, indent=2)
+        print(f"Saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('params') != params:
+            print(f"Warning: baseline was recorded with different parameters: {baseline.get('params')}")
+        regressions = compare(results, baseline.get('results', {}), args.tolerance)
+        if regressions:
+            print("Regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No regressions over {args.compare} (tolerance {args.tolerance:.0%})")
+
+if __name__ == "__main__":
+    main()
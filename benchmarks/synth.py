@@ -0,0 +1,147 @@
+"""
+Reproducible synthetic directory trees (and a stand-in icon font) for the benchmarks.
+
+    python benchmarks/synth.py /tmp/tree --width 4 --depth 3 --files 10 --images 5
+"""
+import argparse
+import os
+import random
+import sys
+from typing import Dict
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+# Extension -> relative weight of files of that kind
+DEFAULT_MIX = "py:4,js:2,md:1,txt:1,json:1,bin:1"
+
+_WORDS = ["tree", "node", "path", "render", "scan", "cache", "glyph", "preview", "theme", "width",
+          "height", "depth", "index", "value", "result", "items", "config", "parse", "write", "close"]
+
+def parse_mix(spec: str) -> Dict[str, int]:
+    mix = {}
+    for part in spec.split(","):
+        ext, _, weight = part.strip().partition(":")
+        mix[ext.lstrip(".")] = int(weight or 1)
+    return mix
+
+def _text(rng: random.Random, ext: str, size: int) -> str:
+    lines, total = [], 0
+    while total < size:
+        words = " ".join(rng.choice(_WORDS) for _ in range(rng.randint(2, 8)))
+        if ext == "py":
+            line = f"{' ' * 4 * rng.randint(0, 2)}{rng.choice(_WORDS)} = {words!r}  # {rng.choice(_WORDS)}"
+        elif ext == "js":
+            line = f"const {rng.choice(_WORDS)} = ({rng.choice(_WORDS)}) => '{words}';"
+        elif ext == "json":
+            line = f'  "{rng.choice(_WORDS)}": "{words}",'
+        elif ext == "md":
+            line = f"{rng.choice(['#', '-', '*', ''])} {words}"
+        else:
+            line = words
+        lines.append(line)
+        total += len(line) + 1
+    return "\n".join(lines) + "\n"
+
+def _image(rng: random.Random, path: str, width: int, height: int):
+    from PIL import Image, ImageDraw
+    img = Image.new("RGB", (width, height), tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(40):
+        x, y = rng.randrange(width), rng.randrange(height)
+        draw.ellipse((x, y, x + rng.randint(10, width // 3), y + rng.randint(10, height // 3)), fill=tuple(rng.randrange(256) for _ in range(3)))
+    img.save(path, "JPEG" if path.endswith(".jpg") else "PNG")
+
+def make_tree(root: str, width: int = 4, depth: int = 3, files: int = 10, mix: str = DEFAULT_MIX,
+              file_size: int = 4096, images: int = 0, image_size: int = 1024, seed: int = 0) -> Dict[str, int]:
+    """
+    Creates `width` subdirectories per directory down to `depth` levels, each directory holding
+    `files` files whose extensions follow `mix` and whose sizes vary around `file_size`. `images`
+    PNG/JPEG images of about `image_size` px are spread over the tree. Same arguments, same tree.
+    """
+    rng = random.Random(seed)
+    kinds = parse_mix(mix)
+    exts, weights = list(kinds), list(kinds.values())
+    stats = {"dirs": 0, "files": 0, "bytes": 0, "images": 0}
+
+    dirs = []
+    def walk(path: str, level: int):
+        os.makedirs(path, exist_ok=True)
+        dirs.append(path)
+        stats["dirs"] += 1
+        for i in range(files):
+            ext = rng.choices(exts, weights)[0]
+            file_path = os.path.join(path, f"{rng.choice(_WORDS)}_{i}.{ext}")
+            size = max(1, int(rng.expovariate(1 / file_size)))
+            if ext == "bin":
+                data = rng.randbytes(size)
+            else:
+                data = _text(rng, ext, size).encode("utf-8")
+            with open(file_path, "wb") as f:
+                f.write(data)
+            stats["files"] += 1
+            stats["bytes"] += len(data)
+        if level < depth:
+            for i in range(width):
+                walk(os.path.join(path, f"{rng.choice(_WORDS)}_dir{i}"), level + 1)
+
+    walk(root, 0)
+    for i in range(images):
+        path = os.path.join(rng.choice(dirs), f"image_{i}.{'jpg' if i % 2 else 'png'}")
+        _image(rng, path, image_size, image_size * 3 // 4)
+        stats["images"] += 1
+        stats["files"] += 1
+        stats["bytes"] += os.path.getsize(path)
+    return stats
+
+def make_font(path: str):
+    """Writes a small TrueType font with a distinct box glyph for every icon svgtree uses."""
+    sys.path.insert(0, SRC_DIR)
+    from fontTools.fontBuilder import FontBuilder
+    from fontTools.pens.ttGlyphPen import TTGlyphPen
+    from svg_tree.consts import ICONS
+
+    names = list(dict.fromkeys(['.notdef'] + [f"uni{ord(c):04X}" for c in ICONS.values()]))
+    glyphs = {}
+    for i, name in enumerate(names):
+        pen = TTGlyphPen(None)
+        if name != '.notdef':
+            k = i * 37 % 900
+            pen.moveTo((100, 100)); pen.lineTo((100, 1000 + k)); pen.lineTo((1000 + k, 1000)); pen.lineTo((1000, 100)); pen.closePath()
+        glyphs[name] = pen.glyph()
+
+    fb = FontBuilder(2048, isTTF=True)
+    fb.setupGlyphOrder(names)
+    fb.setupCharacterMap({ord(c): f"uni{ord(c):04X}" for c in ICONS.values()})
+    fb.setupGlyf(glyphs)
+    fb.setupHorizontalMetrics({name: (2048, 0) for name in names})
+    fb.setupHorizontalHeader(ascent=1800, descent=-248)
+    fb.setupNameTable({'familyName': 'svgtree bench symbols', 'styleName': 'Regular'})
+    fb.setupOS2()
+    fb.setupPost()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    fb.save(path)
+
+def add_tree_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--width", type=int, default=4, help="Subdirectories per directory (default: 4)")
+    parser.add_argument("--depth", type=int, default=3, help="Directory levels (default: 3)")
+    parser.add_argument("--files", type=int, default=10, help="Files per directory (default: 10)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"File types as ext:weight (default: {DEFAULT_MIX})")
+    parser.add_argument("--file-size", type=int, default=4096, help="Mean file size in bytes (default: 4096)")
+    parser.add_argument("--images", type=int, default=0, help="Number of images (default: 0)")
+    parser.add_argument("--image-size", type=int, default=1024, help="Image width in px (default: 1024)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+
+def tree_kwargs(args: argparse.Namespace) -> Dict[str, int]:
+    return dict(width=args.width, depth=args.depth, files=args.files, mix=args.mix, file_size=args.file_size,
+                images=args.images, image_size=args.image_size, seed=args.seed)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic directory tree.")
+    parser.add_argument("root", help="Directory to create the tree in")
+    add_tree_arguments(parser)
+    args = parser.parse_args()
+    stats = make_tree(args.root, **tree_kwargs(args))
+    print(f"{stats['dirs']} dirs, {stats['files']} files ({stats['images']} images), {stats['bytes'] / 1e6:.1f} MB in {args.root}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Hatch build hook that bundles the icon glyph pack (src/svg_tree/assets/glyphs.json), so
+installs from a checkout work offline on their first run. The pack is gitignored and built
+from $SVGTREE_ICON_FONT, the installed icon font, or a fresh download of the font, in that
+order; an up-to-date pack is reused. The build fails if none of them works.
+"""
+import os
+import sys
+import tempfile
+
+from hatchling.builders.hooks.plugin.interface import BuildHookInterface
+
+class GlyphPackBuildHook(BuildHookInterface):
+    PLUGIN_NAME = 'custom'
+
+    def initialize(self, version, build_data):
+        sys.path.insert(0, os.path.join(self.root, 'src'))
+        try:
+            from svg_tree import icons
+            from svg_tree.consts import FONT_URL
+        finally:
+            sys.path.pop(0)
+
+        font_path = os.environ.get('SVGTREE_ICON_FONT')
+        if not font_path and icons.read_glyph_pack() is not None:
+            return
+        if font_path and not os.path.exists(font_path):
+            raise RuntimeError(f"SVGTREE_ICON_FONT={font_path} does not exist")
+        font_path = font_path or (icons.get_font_path() if os.path.exists(icons.get_font_path()) else None)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            if not font_path:
+                from urllib.request import urlopen
+                font_path = os.path.join(tmp_dir, os.path.basename(FONT_URL))
+                self.app.display_info(f"Downloading the icon font for the glyph pack from {FONT_URL}")
+                try:
+                    with urlopen(FONT_URL, timeout=60) as r, open(font_path, 'wb') as f:
+                        f.write(r.read())
+                except Exception as e:
+                    raise RuntimeError(f"Could not download the icon font to build the glyph pack ({e}); set SVGTREE_ICON_FONT to a local copy of {os.path.basename(FONT_URL)}") from e
+            icons.write_glyph_pack(font_path)
+
+        if icons.read_glyph_pack() is None:
+            raise RuntimeError(f"Could not write the glyph pack to {icons.BUNDLED_GLYPH_PACK}")
+        self.app.display_info(f"Glyph pack built from {font_path}")
@@ -14,6 +14,9 @@ if ! command -v uv &> /dev/null; then
 fi
 
 echo "Building wheel with uv..."
+# The build bundles the icon glyph pack (see hatch_build.py), so first runs of the binary need
+# neither the font nor the network. It uses $SVGTREE_ICON_FONT or the installed icon font when
+# there is one and downloads the font otherwise.
 uv build --wheel --clear
 
 echo "Packaging with Shiv..."
@@ -0,0 +1,210 @@
+import os
+import time
+import pickle
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from .config import get_cache_dir
+from .core import Listing, list_dir
+from .ignore import IgnoreKey, IgnoreRules
+
+SCAN_CACHE_VERSION = 2
+
+# Directories modified this recently are not cached: a change within the same mtime tick
+# would otherwise go unnoticed on the next run.
+_MTIME_GRACE_NS = 2_000_000_000
+
+class ScanCache:
+    """
+    Persistent per-directory listings for `build_tree`, keyed by directory path and
+    validated against its mtime and inode and the ignore files that apply to it, so re-runs
+    only scandir directories that changed. One cache file exists per (root, exclude patterns,
+    entry cap) combination.
+    """
+
+    def __init__(self, cache_path: str, dirs: Dict[str, Tuple[int, int, IgnoreKey, Listing]]):
+        self.cache_path = cache_path
+        self.dirs = dirs
+        self.used: Dict[str, Tuple[int, int, IgnoreKey, Listing]] = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, root_path: str, exclude_patterns: Optional[List[str]] = None, max_entries: int = 0) -> 'ScanCache':
+        key = "\0".join([os.path.abspath(root_path)] + list(exclude_patterns or []) + ([f"max_entries={max_entries}"] if max_entries else []))
+        cache_path = os.path.join(get_cache_dir(), 'scan', hashlib.sha256(key.encode('utf-8')).hexdigest() + '.pickle')
+        dirs = {}
+        try:
+            with open(cache_path, 'rb') as f:
+                version, dirs = pickle.load(f)
+            if version != SCAN_CACHE_VERSION:
+                dirs = {}
+        except Exception:
+            dirs = {}
+        return cls(cache_path, dirs)
+
+    def listing(self, path: str, ignore: Optional[IgnoreRules], max_entries: int = 0) -> Listing:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return list_dir(path, ignore, max_entries)
+
+        # Editing an ignore file in place leaves the directory mtime alone, so their stamps are checked too
+        ignore_key = ignore.key(path) if ignore else ()
+        cached = self.dirs.get(path)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_ino and cached[2] == ignore_key:
+            with self._lock:
+                self.hits += 1
+                self.used[path] = cached
+            return cached[3]
+
+        listing = list_dir(path, ignore, max_entries)
+        with self._lock:
+            self.misses += 1
+            if time.time_ns() - st.st_mtime_ns > _MTIME_GRACE_NS:
+                self.used[path] = (st.st_mtime_ns, st.st_ino, ignore_key, listing)
+        return listing
+
+    def save(self):
+        """Writes back the listings used by this run (stale directories are dropped)."""
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump((SCAN_CACHE_VERSION, self.used), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"Warning: Could not write scan cache {self.cache_path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+PREVIEW_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# Bump when the preview cache tables change; older databases are recreated
+PREVIEW_DB_VERSION = 2
+
+# Files above this size are keyed by (path, size, mtime) instead of being hashed
+_CONTENT_HASH_LIMIT = 64 * 1024 * 1024
+
+# Returned by PreviewCache.get on a miss (None is a valid cached preview)
+MISS = object()
+
+FileStamp = Tuple[int, int, str]
+
+def file_stamp(path: str) -> Optional[FileStamp]:
+    """
+    Returns (size, mtime_ns, content digest) of a file, or None if it can't be read. Called
+    by the preview workers, so cold runs hash files in parallel with extracting them.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if st.st_size > _CONTENT_HASH_LIMIT:
+        return st.st_size, st.st_mtime_ns, hashlib.sha256(f"{path}\0{st.st_size}\0{st.st_mtime_ns}".encode('utf-8')).hexdigest()
+    h = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns, h.hexdigest()
+
+class PreviewCache:
+    """
+    Persistent, size-bounded store of `get_preview_data` results. Entries are keyed by the
+    file's content hash, its name (which picks the lexer/mime type) and the preview
+    settings, so identical files share an entry. A (path, size, mtime) table memoizes the
+    hashes, so lookups never read files: a path it doesn't know is a miss, and the hash
+    comes back with the extracted preview (see `file_stamp`). Least recently used entries
+    are evicted past `max_bytes`, along with the hashes no entry uses any more.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, max_bytes: int = PREVIEW_CACHE_MAX_BYTES):
+        import sqlite3
+        self.db_path = db_path or os.path.join(get_cache_dir(), 'previews.sqlite')
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.db = sqlite3.connect(self.db_path, timeout=30)
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != PREVIEW_DB_VERSION:
+            self.db.executescript(f"""
+                DROP TABLE IF EXISTS files;
+                DROP TABLE IF EXISTS previews;
+                PRAGMA user_version = {PREVIEW_DB_VERSION};
+            """)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest TEXT);
+            CREATE TABLE IF NOT EXISTS previews (key TEXT PRIMARY KEY, digest TEXT, data BLOB, nbytes INTEGER, atime REAL);
+            CREATE INDEX IF NOT EXISTS previews_atime ON previews (atime);
+            CREATE INDEX IF NOT EXISTS previews_digest ON previews (digest);
+        """)
+
+    # Tells PreviewBatch to have its workers return each file's `file_stamp` for `put`
+    needs_stamps = True
+
+    def _digest(self, path: str) -> Optional[str]:
+        """The memoized hash of `path` if it is unchanged since it was hashed, else None."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        row = self.db.execute("SELECT size, mtime_ns, digest FROM files WHERE path = ?", (path,)).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return row[2]
+        return None
+
+    @staticmethod
+    def _key(path: str, digest: str, settings_key: str) -> str:
+        return hashlib.sha256(f"{digest}\0{os.path.basename(path)}\0{settings_key}".encode('utf-8')).hexdigest()
+
+    def find(self, path: str, settings_key: str) -> Optional[str]:
+        """Returns the entry key of a cached preview without loading it, or None on a miss."""
+        digest = self._digest(path)
+        key = self._key(path, digest, settings_key) if digest else None
+        row = self.db.execute("SELECT 1 FROM previews WHERE key = ?", (key,)).fetchone() if key else None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return key
+
+    def load(self, key: str):
+        """Loads an entry found by `find`; MISS if it has been evicted since."""
+        row = self.db.execute("SELECT data FROM previews WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return MISS
+        self.db.execute("UPDATE previews SET atime = ? WHERE key = ?", (time.time(), key))
+        return pickle.loads(row[0])
+
+    def get(self, path: str, settings_key: str):
+        key = self.find(path, settings_key)
+        return MISS if key is None else self.load(key)
+
+    def put(self, path: str, settings_key: str, result, stamp: Optional[FileStamp] = None):
+        """Stores a preview; `stamp` is the file's `file_stamp` if the caller already has it."""
+        digest = self._digest(path) if stamp is None else None
+        if digest is None:
+            stamp = stamp or file_stamp(path)
+            if stamp is None:
+                return
+            digest = stamp[2]
+            self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", (path, *stamp))
+        data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        self.db.execute("INSERT OR REPLACE INTO previews VALUES (?, ?, ?, ?, ?)", (self._key(path, digest, settings_key), digest, data, len(data), time.time()))
+
+    def close(self):
+        """Evicts least recently used entries beyond `max_bytes`, drops unused hashes and commits."""
+        total = self.db.execute("SELECT COALESCE(SUM(nbytes), 0) FROM previews").fetchone()[0]
+        if total > self.max_bytes:
+            for key, nbytes in self.db.execute("SELECT key, nbytes FROM previews ORDER BY atime").fetchall():
+                self.db.execute("DELETE FROM previews WHERE key = ?", (key,))
+                total -= nbytes
+                if total <= self.max_bytes:
+                    break
+        self.db.execute("DELETE FROM files WHERE digest NOT IN (SELECT digest FROM previews)")
+        self.db.commit()
+        self.db.close()
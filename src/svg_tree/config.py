@@ -3,6 +3,10 @@ import sys
 import tomllib
 from typing import Dict, Any, Optional
 
+def get_cache_dir() -> str:
+    xdg_cache = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(xdg_cache, 'svgtree')
+
 def load_theme(user_theme_path: Optional[str] = None) -> Dict[str, Any]:
     # 1. Determine paths
     xdg_config = os.environ.get('XDG_CONFIG_HOME', os.path.join(os.path.expanduser('~'), '.config'))
@@ -51,5 +55,8 @@ def load_theme(user_theme_path: Optional[str] = None) -> Dict[str, Any]:
         else:
             print(f"Error: User theme file {user_theme_path} not found.")
             sys.exit(1)
-            
+
+    if isinstance(theme.get('preview'), dict):
+        from .preview import validate_preview_settings
+        validate_preview_settings(theme['preview'])
     return theme
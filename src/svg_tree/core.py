@@ -1,83 +1,284 @@
 import os
-import pathspec
-from typing import List, Generator, Optional, Callable
+import heapq
+from array import array
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import List, Dict, Generator, Iterator, Optional, Callable, Tuple, Union
+
+from .ignore import IgnoreRules
+
+# One directory listing: (name, is_dir) pairs, already filtered and in render order. A final
+# (label, None) pair stands for the entries folded away by `max_entries` (see `more_label`).
+Listing = List[Tuple[str, Optional[bool]]]
+
+FLAG_DIR = 1
+FLAG_LAST = 2
+FLAG_MORE = 4  # summary row of a folded directory; its name is the label
+
+class TreeStore:
+    """
+    Columnar storage for a scanned tree. Entries are kept in pre-order (the order they are
+    rendered in), one slot per entry in each array; names live in a single string buffer.
+    Iterating a store yields the top-level entries, `flatten_tree` yields all of them.
+    """
+
+    def __init__(self, root_path: str):
+        self.root_path = root_path
+        self.name_offsets = array('I', [0])
+        self.parents = array('i')
+        self.depths = array('H')
+        self.flags = array('B')
+        self.ends = array('i')  # index one past the entry's last descendant
+        self._names = ""
+        self._pending_names: List[str] = []
+
+    def append(self, name: str, parent: int, depth: int, is_dir: Optional[bool], is_last: bool) -> int:
+        index = len(self.parents)
+        self._pending_names.append(name)
+        self.name_offsets.append(self.name_offsets[-1] + len(name))
+        self.parents.append(parent)
+        self.depths.append(depth)
+        self.flags.append((FLAG_DIR if is_dir else FLAG_MORE if is_dir is None else 0) | (FLAG_LAST if is_last else 0))
+        self.ends.append(index + 1)
+        return index
+
+    def close(self, index: int):
+        """Marks the end of `index`'s subtree once all its descendants were appended."""
+        self.ends[index] = len(self.parents)
+
+    @classmethod
+    def from_columns(cls, root_path: str, names: str, name_offsets: array, parents: array, depths: array, flags: array, ends: array) -> 'TreeStore':
+        """Builds a store from already laid out columns (see `snapshot`), without copying them."""
+        store = cls(root_path)
+        store._names = names
+        store.name_offsets, store.parents, store.depths, store.flags, store.ends = name_offsets, parents, depths, flags, ends
+        return store
+
+    def name_buffer(self) -> str:
+        """All names, concatenated in entry order; `name_offsets` index into it."""
+        if self._pending_names:
+            self._names += "".join(self._pending_names)
+            self._pending_names = []
+        return self._names
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    def __iter__(self) -> Iterator['TreeEntry']:
+        i = 0
+        while i < len(self.parents):
+            yield TreeEntry(self, i)
+            i = self.ends[i]
+
+    def name(self, index: int) -> str:
+        if self._pending_names:
+            self.name_buffer()
+        return self._names[self.name_offsets[index]:self.name_offsets[index + 1]]
+
+    def path(self, index: int) -> str:
+        parts = []
+        while index >= 0:
+            parts.append(self.name(index))
+            index = self.parents[index]
+        return os.path.join(self.root_path, *reversed(parts))
+
+    def children(self, index: int) -> List['TreeEntry']:
+        out, i = [], index + 1
+        while i < self.ends[index]:
+            out.append(TreeEntry(self, i))
+            i = self.ends[i]
+        return out
 
 class TreeEntry:
-    def __init__(self, name: str, path: str, depth: int, is_dir: bool, is_last_child: bool = False, parent_is_last: List[bool] = None):
-        self.name = name
-        self.path = path
-        self.depth = depth
-        self.is_dir = is_dir
-        self.is_last_child = is_last_child
-        self.parent_is_last = parent_is_last or []
-        self.children: List['TreeEntry'] = []
+    """Lightweight view of one entry of a `TreeStore`."""
+    __slots__ = ('store', 'index')
 
-def build_tree(
-    root_path: str, 
-    max_depth: int, 
-    spec: Optional[pathspec.PathSpec],
-    current_depth: int = 0,
-    parent_is_last: List[bool] = None,
-    on_progress: Optional[Callable[[], None]] = None
-) -> List[TreeEntry]:
-    
-    if current_depth > max_depth:
-        return []
-    
-    if parent_is_last is None:
-        parent_is_last = []
+    def __init__(self, store: TreeStore, index: int):
+        self.store = store
+        self.index = index
+
+    @property
+    def name(self) -> str:
+        return self.store.name(self.index)
+
+    @property
+    def path(self) -> str:
+        return self.store.path(self.index)
+
+    @property
+    def depth(self) -> int:
+        return self.store.depths[self.index]
+
+    @property
+    def is_dir(self) -> bool:
+        return bool(self.store.flags[self.index] & FLAG_DIR)
+
+    @property
+    def is_more(self) -> bool:
+        return bool(self.store.flags[self.index] & FLAG_MORE)
 
-    entries = []
+    @property
+    def is_last_child(self) -> bool:
+        return bool(self.store.flags[self.index] & FLAG_LAST)
+
+    @property
+    def parent_is_last(self) -> List[bool]:
+        store, out = self.store, []
+        parent = store.parents[self.index]
+        while parent >= 0:
+            out.append(bool(store.flags[parent] & FLAG_LAST))
+            parent = store.parents[parent]
+        out.reverse()
+        return out
+
+    @property
+    def children(self) -> List['TreeEntry']:
+        return self.store.children(self.index)
+
+    @property
+    def has_children(self) -> bool:
+        return self.store.ends[self.index] > self.index + 1
+
+def more_label(files: int, dirs: int) -> str:
+    """Text of the summary row standing for `files` files and `dirs` directories left out of a listing."""
+    def plural(n: int, word: str) -> str:
+        return f"{n:,} {word}" + ("" if n == 1 else "s")
+    if not files:
+        return f"\u2026 and {plural(dirs, 'more dir')}"
+    return f"\u2026 and {plural(files, 'more file')}" + (f" ({plural(dirs, 'dir')})" if dirs else "")
+
+def list_dir(path: str, ignore: Optional[IgnoreRules], max_entries: int = 0) -> Listing:
+    """
+    Returns the filtered and sorted (dirs first, then by name) entries of one directory. With
+    `max_entries`, only the first that many are selected (without sorting the rest) and the
+    others are counted into a trailing summary entry.
+    """
+    ignored = ignore.matcher(path) if ignore else None
+    filtered_entries = []
+    dirs = 0
     try:
-        with os.scandir(root_path) as it:
-            raw_entries = sorted(list(it), key=lambda e: (not e.is_dir(), e.name.lower()))
+        with os.scandir(path) as it:
+            for entry in it:
+                # Only process regular files and directories (skips sockets, pipes, etc.)
+                try:
+                    is_dir = entry.is_dir()
+                    if not (is_dir or entry.is_file()):
+                        continue
+                except OSError:
+                    continue
+                # Excluded entries are dropped before sorting, and excluded directories are never opened
+                if ignored and ignored(entry.name, is_dir):
+                    continue
+                filtered_entries.append((entry.name, is_dir))
+                dirs += is_dir
     except PermissionError:
         return []
 
-    filtered_entries = []
-    
-    for entry in raw_entries:
-        # Only process regular files and directories (skips sockets, pipes, etc.)
-        try:
-            if not (entry.is_file() or entry.is_dir()):
-                continue
-        except OSError:
-            continue
-
-        if spec:
-             if spec.match_file(entry.path):
-                 continue
-             if spec.match_file(entry.name):
-                 continue
+    key = lambda e: (not e[1], e[0].lower())
+    if 0 < max_entries < len(filtered_entries):
+        kept = heapq.nsmallest(max_entries, filtered_entries, key=key)
+        kept_dirs = sum(is_dir for _, is_dir in kept)
+        more_dirs = dirs - kept_dirs
+        kept.append((more_label(len(filtered_entries) - max_entries - more_dirs, more_dirs), None))
+        return kept
+    filtered_entries.sort(key=key)
+    return filtered_entries
 
-        filtered_entries.append(entry)
+def _assemble(
+    store: TreeStore,
+    path: str,
+    parent: int,
+    max_depth: int,
+    current_depth: int,
+    get_listing: Callable[[str, int], Listing],
+    on_progress: Optional[Callable[[], None]]
+):
+    # Explicit stack of [listing, next position, parent index, path, depth] frames instead of
+    # recursion, so very deep trees don't hit the recursion limit
+    stack = [[get_listing(path, current_depth), 0, parent, path, current_depth]]
+    while stack:
+        frame = stack[-1]
+        listing, i, parent, path, depth = frame
+        if i == len(listing):
+            stack.pop()
+            if parent >= 0:
+                store.close(parent)
+            continue
+        frame[1] = i + 1
 
-    for i, entry in enumerate(filtered_entries):
         if on_progress:
             on_progress()
 
-        is_last = (i == len(filtered_entries) - 1)
-        is_dir = entry.is_dir()
-        child_parent_is_last = parent_is_last + [is_last]
-        
-        node = TreeEntry(
-            name=entry.name,
-            path=entry.path,
-            depth=current_depth,
-            is_dir=is_dir,
-            is_last_child=is_last,
-            parent_is_last=parent_is_last
-        )
-        
-        if is_dir:
-            node.children = build_tree(entry.path, max_depth, spec, current_depth + 1, child_parent_is_last, on_progress=on_progress)
-            
-        entries.append(node)
-        
-    return entries
-
-def flatten_tree(nodes: List[TreeEntry]) -> Generator[TreeEntry, None, None]:
+        name, is_dir = listing[i]
+        is_last = (i == len(listing) - 1)
+        index = store.append(name, parent, depth, is_dir, is_last)
+
+        if is_dir and depth + 1 <= max_depth:
+            child_path = os.path.join(path, name)
+            stack.append([get_listing(child_path, depth + 1), 0, index, child_path, depth + 1])
+
+def _build_tree_parallel(
+    store: TreeStore,
+    max_depth: int,
+    list_fn: Callable[[str], Listing],
+    current_depth: int,
+    on_progress: Optional[Callable[[], None]],
+    jobs: int
+):
+    """
+    Fans `scandir` calls out to a thread pool. Each worker schedules the scans of the
+    subdirectories it finds before returning, so listings are fetched ahead of (and
+    overlapped with) the main thread, which assembles the tree in the usual order.
+    """
+    futures: Dict[str, Future] = {}
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        def scan(path: str, depth: int) -> Listing:
+            listing = list_fn(path)
+            if depth + 1 <= max_depth:
+                for name, is_dir in listing:
+                    if is_dir:
+                        child_path = os.path.join(path, name)
+                        futures[child_path] = executor.submit(scan, child_path, depth + 1)
+            return listing
+
+        futures[store.root_path] = executor.submit(scan, store.root_path, current_depth)
+        _assemble(store, store.root_path, -1, max_depth, current_depth, lambda path, _: futures.pop(path).result(), on_progress)
+
+def build_tree(
+    root_path: str,
+    max_depth: int,
+    ignore: Optional[IgnoreRules],
+    current_depth: int = 0,
+    on_progress: Optional[Callable[[], None]] = None,
+    jobs: int = 1,
+    cache=None,
+    max_entries: int = 0
+) -> TreeStore:
+    """
+    Scans `root_path` into a TreeStore, leaving out what `ignore` excludes and folding directories
+    with more than `max_entries` entries (see `list_dir`). `cache` is an optional object with a
+    `listing(path, ignore, max_entries)` method (see `cache.ScanCache`) consulted instead of scandir.
+    """
+    store = TreeStore(root_path)
+
+    if current_depth > max_depth:
+        return store
+
+    def list_fn(path: str) -> Listing:
+        return cache.listing(path, ignore, max_entries) if cache else list_dir(path, ignore, max_entries)
+
+    if jobs > 1:
+        _build_tree_parallel(store, max_depth, list_fn, current_depth, on_progress, jobs)
+    else:
+        _assemble(store, root_path, -1, max_depth, current_depth, lambda path, _: list_fn(path), on_progress)
+    return store
+
+def flatten_tree(nodes: Union[TreeStore, List[TreeEntry]]) -> Generator[TreeEntry, None, None]:
+    """Yields entries in render order; a linear walk over the store's arrays."""
+    if isinstance(nodes, TreeStore):
+        for i in range(len(nodes)):
+            yield TreeEntry(nodes, i)
+        return
     for node in nodes:
-        yield node
-        if node.children:
-            yield from flatten_tree(node.children)
+        for i in range(node.index, node.store.ends[node.index]):
+            yield TreeEntry(node.store, i)
@@ -1,13 +1,47 @@
+import os
+import re
+import sys
+import zlib
+import atexit
+import bisect
 import shutil
+import struct
+import tempfile
 import subprocess
-import cairosvg
+from typing import Iterator, List, Optional, Tuple, Union
 
-def convert_with_inkscape(svg_path: str, png_path: str, scale: int):
+# An SVG to convert: a file path, or the document itself
+SvgSource = Union[str, bytes]
+
+# Outputs with more pixels than this are rendered in horizontal bands by `export_png_tiled`
+TILED_MIN_PIXELS = 64 * 1024 * 1024
+# Pixels per band surface (4 bytes each)
+TILE_PIXELS = 16 * 1024 * 1024
+# Larger outputs are split into several images
+MAX_PNG_PIXELS = 512 * 1024 * 1024
+# Cairo image surfaces can't be wider than this
+CAIRO_MAX_SIZE = 32767
+
+_RE_ROOT = re.compile(rb'<svg\b[^>]*>')
+_RE_TRANSLATE = re.compile(r'^\s*translate\(\s*([-\d.e]+)\s*[, ]\s*([-\d.e]+)\s*\)\s*$')
+# Path data `_Connectors` writes: absolute moves and lines, vertical/horizontal segments
+_RE_PATH_DATA = re.compile(r'^[MLVHh\d\s.,e-]*$')
+_RE_PATH_COMMAND = re.compile(r'([MLVHh])([^MLVHh]*)')
+# Glyphs reach this far around a `text`'s y (document units)
+TEXT_MARGIN = 32
+# Children taller than this are tested against every band instead of looked up by position
+_SHORT_SPAN = 2048
+
+def convert_with_inkscape(svg: SvgSource, png_path: str, scale: int):
     try:
         # Inkscape CLI: inkscape input.svg -o output.png --export-dpi=...
         # Standard SVG DPI is usually 96.
         dpi = 96 * scale
-        subprocess.run(["inkscape", svg_path, "-o", png_path, "--export-dpi", str(dpi)], check=True)
+        if isinstance(svg, bytes):
+            # Document piped through stdin, no temp file
+            subprocess.run(["inkscape", "--pipe", "--export-type=png", "-o", png_path, "--export-dpi", str(dpi)], input=svg, check=True)
+        else:
+            subprocess.run(["inkscape", svg, "-o", png_path, "--export-dpi", str(dpi)], check=True)
         print(f"PNG tree generated at: {png_path} (via Inkscape @ {scale}x)")
     except subprocess.CalledProcessError as e:
         print(f"Inkscape failed: {e}")
@@ -17,20 +51,312 @@ def convert_with_inkscape(svg_path: str, png_path: str, scale: int):
         print("Inkscape not found.")
         raise
 
-def export_png(svg_path: str, png_path: str, scale: int):
+class InkscapeShell:
+    """
+    One long-lived `inkscape --shell` process for converting many documents, so Inkscape's
+    startup is only paid once (see `get_inkscape_shell`). The shell can only open files,
+    so in-memory documents go through a temp file that is reused for every conversion.
+    """
+    PROMPT = b"> "
+
+    def __init__(self):
+        self.proc: Optional[subprocess.Popen] = None
+        self._tmp_path: Optional[str] = None
+
+    def _start(self):
+        self.proc = subprocess.Popen(["inkscape", "--shell"], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self._wait_prompt()
+
+    def _wait_prompt(self):
+        out = b""
+        while not out.endswith(self.PROMPT):
+            chunk = os.read(self.proc.stdout.fileno(), 4096)
+            if not chunk:
+                self.proc = None
+                raise RuntimeError("Inkscape shell exited")
+            out += chunk
+
+    def convert(self, svg: SvgSource, png_path: str, scale: int):
+        if isinstance(svg, bytes):
+            if self._tmp_path is None:
+                fd, self._tmp_path = tempfile.mkstemp(prefix='svgtree-', suffix='.svg')
+                os.close(fd)
+            with open(self._tmp_path, 'wb') as f:
+                f.write(svg)
+            svg = self._tmp_path
+        svg_path, png_path = os.path.abspath(svg), os.path.abspath(png_path)
+        # Actions are separated by ';' and take everything after the first ':' as their argument
+        if ';' in svg_path or ';' in png_path or '\n' in svg_path + png_path:
+            raise ValueError(f"Path not supported by the Inkscape shell: {png_path}")
+
+        if self.proc is None or self.proc.poll() is not None:
+            self._start()
+        if os.path.exists(png_path):
+            os.remove(png_path)
+        actions = f"file-open:{svg_path}; export-filename:{png_path}; export-dpi:{96 * scale}; export-do; file-close\n"
+        self.proc.stdin.write(actions.encode('utf-8'))
+        self.proc.stdin.flush()
+        self._wait_prompt()
+        if not os.path.exists(png_path):
+            raise RuntimeError(f"Inkscape shell did not write {png_path}")
+        print(f"PNG tree generated at: {png_path} (via Inkscape shell @ {scale}x)")
+
+    def close(self):
+        if self.proc is not None and self.proc.poll() is None:
+            try:
+                self.proc.stdin.write(b"quit\n")
+                self.proc.stdin.close()
+                self.proc.wait(timeout=10)
+            except Exception:
+                self.proc.kill()
+        self.proc = None
+        if self._tmp_path:
+            try:
+                os.remove(self._tmp_path)
+            except OSError:
+                pass
+            self._tmp_path = None
+
+_SHELL: Optional[InkscapeShell] = None
+
+def get_inkscape_shell() -> InkscapeShell:
+    global _SHELL
+    if _SHELL is None:
+        _SHELL = InkscapeShell()
+        atexit.register(_SHELL.close)
+    return _SHELL
+
+def svg_size(svg: SvgSource) -> Optional[Tuple[float, float]]:
+    """Width and height (in px) from the root tag, or None if they aren't plain numbers."""
+    if isinstance(svg, str):
+        with open(svg, 'rb') as f:
+            svg = f.read(4096)
+    match = _RE_ROOT.search(svg[:4096])
+    if not match:
+        return None
+    size = []
+    for attr in (b'width', b'height'):
+        value = re.search(rb'\s' + attr + rb'="([\d.]+)(?:px)?"', match.group(0))
+        if not value:
+            return None
+        size.append(float(value.group(1)))
+    return size[0], size[1]
+
+class _PngStreamWriter:
+    """Minimal RGBA PNG encoder that compresses rows as they are written."""
+
+    def __init__(self, path: str, width: int, height: int):
+        self.f = open(path, 'wb')
+        self.width = width
+        self._z = zlib.compressobj(6)
+        self.f.write(b'\x89PNG\r\n\x1a\n')
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0))
+
+    def _chunk(self, kind: bytes, data: bytes):
+        self.f.write(struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+    def write_rows(self, rgba: bytes):
+        stride = self.width * 4
+        lines = bytearray()
+        for i in range(0, len(rgba), stride):
+            lines += b'\x00'  # filter type: none
+            lines += rgba[i:i + stride]
+        data = self._z.compress(bytes(lines))
+        if data:
+            self._chunk(b'IDAT', data)
+
+    def close(self):
+        self._chunk(b'IDAT', self._z.flush())
+        self._chunk(b'IEND', b'')
+        self.f.close()
+
+def _number(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _path_span(d: str) -> Optional[Tuple[float, float]]:
+    """Vertical extent of path data made only of absolute M/L/V and H/h commands."""
+    if not _RE_PATH_DATA.match(d):
+        return None
+    ys = []
+    for command, args in _RE_PATH_COMMAND.findall(d):
+        values = args.replace(',', ' ').split()
+        if command in 'ML':
+            ys.extend(float(v) for v in values[1::2])
+        elif command == 'V':
+            ys.extend(float(v) for v in values)
+    return (min(ys), max(ys)) if ys else None
+
+def _child_spans(tree, height: float) -> Tuple[list, list]:
+    """
+    Splits the root's children into the ones always drawn and the ones with a known vertical
+    extent, as (document position, node) and (top, bottom, position, node). Extents come from
+    the `translate(0, y)` row groups (each reaching the next one), and, for optimized SVGs
+    (see `generate_svg(optimize=True)`), from the `y` of texts and icons, the box of translated
+    preview groups and the coordinates of connector paths.
+    """
+    fixed, rows, spans = [], [], []
+    for i, child in enumerate(tree.children):
+        span = None
+        match = _RE_TRANSLATE.match(child.get('transform', '')) if child.tag == 'g' else None
+        if match and float(match.group(1)) == 0:
+            rows.append((float(match.group(2)), i, child))
+            continue
+        if match:
+            box = next((_number(c.get('height')) for c in child.children if c.get('height') is not None), None)
+            if box is not None:
+                top = float(match.group(2))
+                span = (top, top + box)
+        elif child.tag == 'path':
+            span = _path_span(child.get('d', ''))
+            if span:
+                span = (span[0] - 1, span[1] + 1)
+        elif child.tag in ('text', 'use') and 'transform' not in child:
+            y, h = _number(child.get('y')), _number(child.get('height', 0))
+            if y is not None and h is not None:
+                span = (y - TEXT_MARGIN, y + h + TEXT_MARGIN)
+        if span:
+            spans.append((span[0], span[1], i, child))
+        else:
+            fixed.append((i, child))
+    rows.sort(key=lambda r: r[0])
+    for (y, i, child), end in zip(rows, [r[0] for r in rows[1:]] + [height]):
+        spans.append((y, end, i, child))
+    return fixed, spans
+
+def _render_bands(tree, scale: float, top: int, bottom: int, width: int, height: int) -> Iterator[bytes]:
+    """
+    Yields the RGBA pixels of output rows [top, bottom) of a parsed CairoSVG `tree`, at
+    most TILE_PIXELS at a time.
+    """
+    from PIL import Image
+    from cairosvg.surface import PNGSurface, cairo
+
+    class BandSurface(PNGSurface):
+        """Draws the whole document but only allocates (and keeps) one band of it."""
+
+        def __init__(self, tree, band_top: int, band_rows: int):
+            self.band_top, self.band_rows = band_top, band_rows
+            super().__init__(tree, None, 96, scale=scale)
+
+        def _create_surface(self, width, height):
+            return cairo.ImageSurface(cairo.FORMAT_ARGB32, int(round(width)), self.band_rows), int(round(width)), self.band_rows
+
+        def set_context_size(self, width, height, viewbox, tree):
+            self.context.translate(0, -self.band_top)
+            super().set_context_size(width, height, viewbox, tree)
+
+    all_children = tree.children
+    fixed, spans = _child_spans(tree, height / scale)
+    # Short spans are looked up by their top, the few tall ones (long connector paths) tested one by one
+    short = sorted((span for span in spans if span[1] - span[0] <= _SHORT_SPAN), key=lambda s: s[0])
+    tall = [span for span in spans if span[1] - span[0] > _SHORT_SPAN]
+    tops = [span[0] for span in short]
+    raw_mode = 'BGRa' if sys.byteorder == 'little' else 'aRGB'
+    band_rows = max(1, TILE_PIXELS // width)
+    try:
+        for band_top in range(top, bottom, band_rows):
+            n = min(band_rows, bottom - band_top)
+            # Only the children overlapping the band are drawn
+            y0, y1 = band_top / scale, (band_top + n) / scale
+            lo = bisect.bisect_left(tops, y0 - _SHORT_SPAN)
+            hi = bisect.bisect_left(tops, y1)
+            drawn = fixed + [(i, child) for top, bottom, i, child in short[lo:hi] + tall if bottom > y0 and top < y1]
+            tree.children = [child for _, child in sorted(drawn, key=lambda c: c[0])]
+            surface = BandSurface(tree, band_top, n)
+            surface.cairo.flush()
+            image = Image.frombuffer('RGBA', (surface.width, n), surface.cairo.get_data(), 'raw', raw_mode, surface.cairo.get_stride(), 1)
+            if image.width != width:
+                image = image.crop((0, 0, width, n))
+            yield image.tobytes()
+            surface.cairo.finish()
+    finally:
+        tree.children = all_children
+
+def export_png_tiled(svg: SvgSource, png_path: str, scale: int) -> List[str]:
+    """
+    Renders `svg` with CairoSVG one horizontal band at a time, streaming the rows into the
+    PNG, so memory stays bounded whatever the output size. The scale is lowered if the
+    image would be wider than Cairo allows; images over MAX_PNG_PIXELS are split into
+    numbered parts. Returns the paths written.
+    """
+    size = svg_size(svg)
+    if not size:
+        raise ValueError("Tiled export needs an SVG with a numeric width and height")
+    width, height = size
+    while scale > 1 and width * scale > CAIRO_MAX_SIZE:
+        scale -= 1
+    if width * scale > CAIRO_MAX_SIZE:
+        raise ValueError(f"SVG too wide to rasterize ({width}px)")
+    # Same rounding as CairoSVG's own surfaces
+    out_w, out_h = int(round(width * scale)), int(round(height * scale))
+
+    part_rows = max(1, MAX_PNG_PIXELS // out_w)
+    parts = (out_h + part_rows - 1) // part_rows
+    if parts > 1:
+        from .render import page_path
+        print(f"PNG would be {out_w}x{out_h}px, splitting it into {parts} images")
+
+    from cairosvg.parser import Tree
+    tree = Tree(bytestring=svg) if isinstance(svg, bytes) else Tree(url=svg)
+    written = []
+    for part in range(parts):
+        path = page_path(png_path, part + 1, parts) if parts > 1 else png_path
+        top, bottom = part * part_rows, min(out_h, (part + 1) * part_rows)
+        png = _PngStreamWriter(path, out_w, bottom - top)
+        try:
+            for rgba in _render_bands(tree, scale, top, bottom, out_w, out_h):
+                png.write_rows(rgba)
+        finally:
+            png.close()
+        written.append(path)
+        print(f"PNG tree generated at: {path} (via CairoSVG, tiled @ {scale}x)")
+    return written
+
+def export_png(svg: SvgSource, png_path: str, scale: int, batch: bool = False, tiled: Optional[bool] = None):
+    """
+    Rasterizes `svg` (a path or the SVG bytes) to `png_path`. With `batch` (callers that
+    convert more than one document per process), Inkscape runs as a shared shell process,
+    which can only open files, so SVG bytes go through its reused temp file. Without it,
+    Inkscape is started for this one document and SVG bytes are piped to it (`--pipe`). `tiled` forces
+    (or rules out) `export_png_tiled`; by default it is used for outputs over TILED_MIN_PIXELS.
+    """
+    if tiled is None:
+        size = svg_size(svg)
+        tiled = bool(size) and size[0] * size[1] * scale * scale > TILED_MIN_PIXELS
+    if tiled:
+        try:
+            export_png_tiled(svg, png_path, scale)
+            return
+        except Exception as e:
+            print(f"Tiled export failed ({e}), rendering in one piece...")
+
     # Priority: Inkscape -> CairoSVG
     used_inkscape = False
     if shutil.which("inkscape"):
         try:
-            convert_with_inkscape(svg_path, png_path, scale)
+            if batch:
+                try:
+                    get_inkscape_shell().convert(svg, png_path, scale)
+                except (OSError, RuntimeError, ValueError) as e:
+                    print(f"Inkscape shell failed ({e}), starting Inkscape for this file...")
+                    convert_with_inkscape(svg, png_path, scale)
+            else:
+                convert_with_inkscape(svg, png_path, scale)
             used_inkscape = True
         except Exception:
             pass
-    
+
     if not used_inkscape:
         try:
-            with open(svg_path, 'rb') as svg_file:
-                cairosvg.svg2png(file_obj=svg_file, write_to=png_path, scale=scale)
+            import cairosvg
+            if isinstance(svg, bytes):
+                cairosvg.svg2png(bytestring=svg, write_to=png_path, scale=scale)
+            else:
+                with open(svg, 'rb') as svg_file:
+                    cairosvg.svg2png(file_obj=svg_file, write_to=png_path, scale=scale)
             print(f"PNG tree generated at: {png_path} (via CairoSVG @ {scale}x)")
         except Exception as e:
             print(f"Error generating PNG: {e}")
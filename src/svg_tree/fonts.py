@@ -0,0 +1,119 @@
+import io
+import os
+import base64
+import hashlib
+import logging
+import mimetypes
+from typing import Dict, Iterable, Optional, Tuple
+
+from .config import get_cache_dir
+
+# Subsets kept on disk; the least recently written are dropped beyond this
+FONT_CACHE_MAX_FILES = 256
+_FORMATS = {'woff2': ('font/woff2', 'woff2'), 'woff': ('font/woff', 'woff')}
+FONT_FLAVORS = ('web', 'woff2', 'woff', 'sfnt')
+
+_DIGESTS: Dict[Tuple[str, int, int], str] = {}
+_SUBSETS: Dict[str, bytes] = {}
+
+def _digest(path: str) -> str:
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    if key not in _DIGESTS:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        _DIGESTS[key] = h.hexdigest()
+    return _DIGESTS[key]
+
+def _web_flavor() -> str:
+    """WOFF2 needs a brotli module; WOFF only zlib."""
+    for module in ('brotli', 'brotlicffi'):
+        try:
+            __import__(module)
+            return 'woff2'
+        except ImportError:
+            pass
+    return 'woff'
+
+def _prune(cache_dir: str):
+    try:
+        paths = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir)]
+        paths.sort(key=os.path.getmtime)
+        for path in paths[:-FONT_CACHE_MAX_FILES]:
+            os.remove(path)
+    except OSError:
+        pass
+
+def subset_font(font_path: str, chars: Iterable[str], flavor: str = 'web') -> Tuple[bytes, str]:
+    """
+    Returns the glyphs of `font_path` needed for `chars`, plus the flavor they were saved in:
+    'sfnt' keeps a plain TrueType/OpenType font, 'web' picks WOFF2 (or, without brotli, WOFF).
+    Subsets are cached in memory and under the cache dir by the font's hash, the flavor and
+    the character set.
+    """
+    if flavor not in FONT_FLAVORS:
+        raise ValueError(f"unknown font flavor {flavor!r}")
+    text = "".join(sorted(set(chars) | {' '}))
+    if flavor == 'web':
+        flavor = _web_flavor()
+    key = hashlib.sha256(f"{_digest(font_path)}:{flavor}:{text}".encode('utf-8')).hexdigest()
+    data = _SUBSETS.get(key)
+    if data is not None:
+        return data, flavor
+
+    cache_dir = os.path.join(get_cache_dir(), 'fonts')
+    cache_path = os.path.join(cache_dir, f"{key}.{flavor}")
+    try:
+        with open(cache_path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        from fontTools import subset
+        # It warns about every table it drops (e.g. FFTM), which is expected here
+        logging.getLogger('fontTools.subset').setLevel(logging.ERROR)
+        options = subset.Options()
+        options.flavor = None if flavor == 'sfnt' else flavor
+        font = subset.load_font(font_path, options, dontLoadGlyphNames=True)
+        subsetter = subset.Subsetter(options)
+        subsetter.populate(text=text)
+        subsetter.subset(font)
+        buf = io.BytesIO()
+        subset.save_font(font, buf, options)
+        data = buf.getvalue()
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, cache_path)
+            _prune(cache_dir)
+        except OSError:
+            pass
+    _SUBSETS[key] = data
+    return data, flavor
+
+def font_face_rule(font_path: str, family: str, weight: str, chars: Optional[Iterable[str]] = None, flavor: str = 'web') -> str:
+    """
+    CSS @font-face embedding `font_path` as a data URI: subset to `chars` in the given flavor
+    (see `subset_font`; use 'sfnt' for SVGs that CairoSVG or Inkscape rasterize, they don't
+    read WOFF), the whole file if no characters are given or subsetting fails. Returns "" if
+    the font can't be read.
+    """
+    try:
+        if chars is None:
+            raise ValueError("no character set")
+        data, flavor = subset_font(font_path, chars, flavor)
+        if flavor == 'sfnt':
+            mime_type, css_format = ('font/otf', 'opentype') if data[:4] == b'OTTO' else ('font/ttf', 'truetype')
+        else:
+            mime_type, css_format = _FORMATS[flavor]
+    except Exception:
+        try:
+            with open(font_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return ""
+        mime_type, css_format = mimetypes.guess_type(font_path)[0] or "font/ttf", "truetype"
+    b64_data = base64.b64encode(data).decode('utf-8')
+    return f"@font-face {{ font-family: \"{family}\"; src: url(\"data:{mime_type};base64,{b64_data}\") format(\"{css_format}\"); font-weight: {weight}; font-style: normal; }}"
@@ -1,13 +1,13 @@
 import os
 import html
+import json
 import pathspec
-from typing import List, Dict, Any, Optional, Callable
-from fontTools.ttLib import TTFont
-from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, Callable, TextIO, Union
 
-from .core import TreeEntry, flatten_tree
-from .icons import get_font_path, ensure_font_exists, get_glyph_path, get_icon_and_color
-from .preview import get_preview_data
+from .core import TreeEntry, TreeStore, flatten_tree
+from .icons import load_glyph_paths, get_icon_and_color
+from .pool import get_preview_pool
+from .profiling import stage
 
 CSS_TEMPLATE = """
 <style>
@@ -24,83 +24,369 @@ CSS_TEMPLATE = """
     .children.open {{ display: block; }}
     .preview-container {{ margin-left: 24px; margin-top: 5px; margin-bottom: 10px; padding: 10px; background: rgba(0, 0, 0, 0.2); border: 1px solid {line_color}; border-radius: 5px; }}
     .preview-code pre {{ margin: 0; font-size: 12px; overflow-x: auto; }}
+    .preview-truncated {{ margin-top: 4px; font-size: 12px; font-style: italic; opacity: 0.6; }}
+    .more {{ font-style: italic; opacity: 0.6; padding-left: 24px; }}
+    #search {{ align-self: flex-start; width: 300px; margin-bottom: 10px; padding: 4px 8px; background: rgba(0, 0, 0, 0.2); color: {text_file}; border: 1px solid {line_color}; border-radius: 4px; }}
+    .row.match {{ background-color: rgba(255, 255, 255, 0.15); }}
+    .searching li:not(.shown) {{ display: none; }}
 </style>
 """
 
 JS = "<script>function toggle(id) { var el = document.getElementById(id); if (el) el.classList.toggle('open'); }</script>"
 
-def _node_to_html(node: TreeEntry, theme, id_counter, preview_data, on_progress):
-    if on_progress: on_progress()
-    node_id = f"node-{id_counter[0]}"
-    id_counter[0] += 1
+SEARCH_BOX = '<input id="search" type="search" placeholder="Search names or paths (a/b)"{attrs}>'
+
+# Filters the static page in place: hides every row that neither matches nor leads to a match.
+# Names, paths and parents are read from the DOM once, on the first search; typing is debounced,
+# and only the rows marked by the previous search are touched again.
+SEARCH_JS = """<script>
+var searchIndex = null, searchMarked = [], searchTimer = null;
+function buildSearchIndex() {
+    var items = document.querySelectorAll('ul.root li'), pos = new Map(), S = {items: items, parent: new Int32Array(items.length), names: [], paths: []}, k, p;
+    for (k = 0; k < items.length; k++) {
+        pos.set(items[k], k);
+        p = items[k].parentElement.closest('li');
+        S.parent[k] = p ? pos.get(p) : -1;
+        S.names.push(items[k].firstChild.textContent.toLowerCase());
+        S.paths.push(S.parent[k] < 0 ? S.names[k] : S.paths[S.parent[k]] + '/' + S.names[k]);
+    }
+    return S;
+}
+function searchSoon(q) { clearTimeout(searchTimer); searchTimer = setTimeout(function () { search(q); }, 100); }
+function search(q) {
+    q = q.trim().toLowerCase();
+    var S = searchIndex || (searchIndex = buildSearchIndex()), name = q.slice(q.lastIndexOf('/') + 1), shown, k, j, li;
+    for (k = 0; k < searchMarked.length; k++) searchMarked[k].classList.remove('shown', 'match');
+    searchMarked = [];
+    document.querySelector('ul.root').classList.toggle('searching', !!q);
+    if (!q) return;
+    shown = new Uint8Array(S.items.length);
+    for (k = 0; k < S.items.length; k++) {
+        if (S.names[k].indexOf(name) < 0 || (name !== q && S.paths[k].indexOf(q) < 0)) continue;
+        S.items[k].firstChild.classList.add('match');
+        searchMarked.push(S.items[k].firstChild);
+        for (j = k; j >= 0 && !shown[j]; j = S.parent[j]) {
+            shown[j] = 1;
+            li = S.items[j];
+            li.classList.add('shown');
+            searchMarked.push(li);
+            if (li.parentElement.classList.contains('children')) li.parentElement.classList.add('open');
+        }
+    }
+}
+</script>"""
+
+# The 'auto' search mode ships a prebuilt index from this many rows (virtual viewer only);
+# smaller trees are searched with a linear scan over the names
+SEARCH_INDEX_MIN_ROWS = 50000
+
+# The 'auto' viewer switches to the virtualized one from this many rows
+VIRTUAL_MIN_ROWS = 10000
+VIRTUAL_ROW_HEIGHT = 24
+
+VIRTUAL_CSS = """
+<style>
+    body {{ margin: 0; height: 100vh; box-sizing: border-box; display: flex; flex-direction: column; }}
+    h3 {{ margin-top: 0; }}
+    #main {{ flex: 1; min-height: 0; display: flex; gap: 20px; }}
+    #view {{ flex: 1; overflow-y: auto; position: relative; }}
+    #rows {{ position: absolute; left: 0; right: 0; }}
+    #rows .row {{ height: {row_height}px; box-sizing: border-box; white-space: nowrap; }}
+    .has-preview .file-name {{ text-decoration: underline dotted; }}
+    #pane {{ flex: 1; overflow: auto; display: none; margin-top: 0; }}
+    #pane.open {{ display: block; }}
+</style>
+"""
+
+# Renders only the rows in (and slightly around) the viewport. The tree is the pre-order
+# arrays from #tree-data: names (n), subtree sizes (s), flags (f: 1 = dir, 2 = has preview, 4 = summary)
+# and icon style ids (k) into [codepoint, color] pairs (st). Children are materialized into
+# the visible row list on expand; previews are parsed from their own data block on click.
+VIRTUAL_JS = """<script>
+(function () {
+    var H = %d, OVERSCAN = 20;
+    var T = JSON.parse(document.getElementById('tree-data').textContent);
+    var N = T.n.length, open = new Uint8Array(N), depth = new Uint16Array(N), parent = new Int32Array(N), stack = [], rows = [];
+    for (var i = 0; i < N; i++) {
+        while (stack.length && stack[stack.length - 1] + T.s[stack[stack.length - 1]] <= i) stack.pop();
+        depth[i] = stack.length;
+        parent[i] = stack.length ? stack[stack.length - 1] : -1;
+        if (T.s[i] > 1) stack.push(i);
+    }
+    for (var j = 0; j < N; j += T.s[j]) rows.push(j);
+
+    function visible(i, out) {
+        for (var j = i + 1, e = i + T.s[i]; j < e; j += T.s[j]) {
+            out.push(j);
+            if (open[j]) visible(j, out);
+        }
+        return out;
+    }
+    function esc(s) { return s.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;'); }
+
+    var view = document.getElementById('view'), box = document.getElementById('search'), hit = null, spacer = document.getElementById('spacer');
+    var list = document.getElementById('rows'), pane = document.getElementById('pane');
+    function render() {
+        spacer.style.height = rows.length * H + 'px';
+        var first = Math.max(0, Math.floor(view.scrollTop / H) - OVERSCAN);
+        var last = Math.min(rows.length, Math.ceil((view.scrollTop + view.clientHeight) / H) + OVERSCAN);
+        var out = [];
+        for (var r = first; r < last; r++) {
+            var i = rows[r], st = T.st[T.k[i]];
+            out.push('<div class="row' + (T.f[i] & 2 ? ' has-preview' : '') + (hit && hit[i] ? ' match' : '') + '" data-r="' + r + '" style="padding-left: ' + (depth[i] * 20 + 5) + 'px">' +
+                (T.f[i] & 4 ? '<span class="more">' + esc(T.n[i]) + '</span></div>' :
+                '<svg class="icon" style="fill: ' + st[1] + '"><use href="#icon-' + st[0] + '" /></svg>' +
+                '<span class="' + (T.f[i] & 1 ? 'folder-name' : 'file-name') + '">' + esc(T.n[i]) + '</span></div>'));
+        }
+        list.style.top = first * H + 'px';
+        list.innerHTML = out.join('');
+    }
+
+    var pending = false;
+    view.addEventListener('scroll', function () {
+        if (pending) return;
+        pending = true;
+        requestAnimationFrame(function () { pending = false; render(); });
+    });
+    window.addEventListener('resize', render);
+    list.addEventListener('click', function (ev) {
+        var row = ev.target.closest('.row');
+        if (!row) return;
+        var r = +row.dataset.r, i = rows[r];
+        if (T.f[i] & 1) {
+            if (open[i]) {
+                var k = r + 1, e = i + T.s[i];
+                while (k < rows.length && rows[k] < e) k++;
+                rows.splice(r + 1, k - r - 1);
+            } else {
+                rows = rows.slice(0, r + 1).concat(visible(i, []), rows.slice(r + 1));
+            }
+            open[i] ^= 1;
+            render();
+        } else if (T.f[i] & 2) {
+            var el = document.getElementById('p-' + i);
+            pane.innerHTML = '<div class="file-name">' + esc(T.n[i]) + '</div>' + (el ? JSON.parse(el.textContent) : '');
+            pane.classList.add('open');
+        }
+    });
+
+    // Search: names are matched through the trigram index in #search-index when there is one
+    // (u: name id per entry, t: trigram -> delta-encoded name ids), by a linear scan otherwise
+    var index = null, lower = [];
+    function lowerName(i) { return lower[i] || (lower[i] = T.n[i].toLowerCase()); }
+    function pathOf(i) {
+        var parts = [];
+        for (; i >= 0; i = parent[i]) parts.push(T.n[i]);
+        return parts.reverse().join('/').toLowerCase();
+    }
+    function find(q) {
+        var name = q.slice(q.lastIndexOf('/') + 1), found = new Uint8Array(N), el = document.getElementById('search-index'), i;
+        if (el && name.length >= 3) {
+            if (!index) index = JSON.parse(el.textContent);
+            var ids = null;
+            for (var k = 0; k + 3 <= name.length; k++) {
+                var post = index.t[name.substr(k, 3)], next = new Set();
+                if (!post) return found;
+                for (var p = 0, id = 0; p < post.length; p++) {
+                    id += post[p];
+                    if (!ids || ids.has(id)) next.add(id);
+                }
+                ids = next;
+            }
+            for (i = 0; i < N; i++) if (ids.has(index.u[i]) && lowerName(i).indexOf(name) >= 0) found[i] = 1;
+        } else {
+            for (i = 0; i < N; i++) if (lowerName(i).indexOf(name) >= 0) found[i] = 1;
+        }
+        if (name !== q) for (i = 0; i < N; i++) if (found[i] && pathOf(i).indexOf(q) < 0) found[i] = 0;
+        return found;
+    }
+    function search() {
+        var q = box.value.trim().toLowerCase(), i;
+        rows = [];
+        if (!q) {
+            hit = null;
+            for (i = 0; i < N; i += T.s[i]) { rows.push(i); if (open[i]) visible(i, rows); }
+        } else {
+            // Show the matches and the folders leading to them, expanding those folders
+            hit = find(q);
+            var keep = new Uint8Array(N);
+            for (i = 0; i < N; i++) {
+                if (!hit[i]) continue;
+                keep[i] = 1;
+                for (var a = parent[i]; a >= 0 && !(keep[a] && open[a]); a = parent[a]) keep[a] = open[a] = 1;
+            }
+            for (i = 0; i < N; ) {
+                if (keep[i]) rows.push(i++);
+                else i += T.s[i];
+            }
+        }
+        view.scrollTop = 0;
+        render();
+    }
+    var timer = null;
+    if (box) box.addEventListener('input', function () { clearTimeout(timer); timer = setTimeout(search, 50); });
+    render();
+})();
+</script>""" % VIRTUAL_ROW_HEIGHT
+
+def build_search_index(names: List[str]) -> Dict[str, Any]:
+    """
+    Trigram index over the distinct lowercased names: `u` holds the name id of every entry,
+    `t` maps each trigram to the (delta-encoded, ascending) ids of the names containing it.
+    """
+    ids, unique, trigrams = [], {}, {}
+    for name in names:
+        key = name.lower()
+        uid = unique.get(key)
+        if uid is None:
+            uid = unique[key] = len(unique)
+            for trigram in {key[i:i + 3] for i in range(len(key) - 2)}:
+                trigrams.setdefault(trigram, []).append(uid)
+        ids.append(uid)
+    for post in trigrams.values():
+        for i in range(len(post) - 1, 0, -1):
+            post[i] -= post[i - 1]
+    return {'u': ids, 't': trigrams}
+
+def _json_script(value: Any) -> str:
+    # Escaping "<" keeps "</script>" or "<!--" inside the data from ending the block early
+    return json.dumps(value, separators=(',', ':')).replace('<', '\\u003c')
+
+def _row_html(node: TreeEntry, theme: Dict[str, Any]) -> str:
+    if node.is_more:
+        return f'<li><div class="row"><span class="more">{html.escape(node.name)}</span></div>'
     icon_char, color = get_icon_and_color(node.name, node.is_dir, theme)
-    icon_id = f"icon-{ord(icon_char)}"
-    
-    icon_html = f'<svg class="icon" style="fill: {color}"><use href="#{icon_id}" /></svg>'
+    icon_html = f'<svg class="icon" style="fill: {color}"><use href="#icon-{ord(icon_char)}" /></svg>'
     text_class = "folder-name" if node.is_dir else "file-name"
-    
-    preview_html = ""
-    content = preview_data.get(node.path)
-    if content:
-        preview_html = f'<div class="preview-container">{content}</div>'
-
-    html_out = f'<li><div class="row" {"onclick=\"toggle(\\'" + node_id + "\\')\"" if node.is_dir else ""}>{icon_html}<span class="{text_class}">{html.escape(node.name)}</span></div>'
-    if node.is_dir and node.children:
-        html_out += f'<ul id="{node_id}" class="children">'
-        for child in node.children:
-            html_out += _node_to_html(child, theme, id_counter, preview_data, on_progress)
-        html_out += "</ul>"
-    elif preview_html:
-        html_out += preview_html
-    html_out += "</li>"
-    return html_out
-
-def generate_html(root_path: str, output_path: str, tree_nodes: List[TreeEntry], theme: Dict[str, Any], preview_patterns: Optional[str] = None, on_progress: Optional[Callable[[], None]] = None):
-    ensure_font_exists()
-    font_path = get_font_path()
-    try: font = TTFont(font_path)
+    onclick = f'onclick="toggle(\'node-{node.index}\')"' if node.is_dir else ""
+    return f'<li><div class="row" {onclick}>{icon_html}<span class="{text_class}">{html.escape(node.name)}</span></div>'
+
+def _write_static(f, tree_nodes: TreeStore, theme: Dict[str, Any], previews, on_progress: Optional[Callable[[], None]]):
+    f.write('<ul class="root">')
+
+    # Depths of the directories whose <ul> is currently open
+    open_dirs = []
+    for node in flatten_tree(tree_nodes):
+        depth = node.depth
+        while open_dirs and open_dirs[-1] >= depth:
+            f.write("</ul></li>")
+            open_dirs.pop()
+
+        if on_progress: on_progress()
+        f.write(_row_html(node, theme))
+        if node.is_dir and node.has_children:
+            f.write(f'<ul id="node-{node.index}" class="children">')
+            open_dirs.append(depth)
+            continue
+
+        if node.index in previews:
+            if on_progress: on_progress()
+            content = previews.get(node.index)
+            if content:
+                f.write(f'<div class="preview-container">{content}</div>')
+        f.write("</li>")
+
+    f.write("</ul></li>" * len(open_dirs))
+    f.write("</ul>")
+
+def _write_virtual(f, tree_nodes: TreeStore, theme: Dict[str, Any], previews, on_progress: Optional[Callable[[], None]], search_index: bool = False):
+    names, sizes, flags, kinds = [], [], [], []
+    styles, style_ids = [], {}
+    for node in flatten_tree(tree_nodes):
+        if on_progress: on_progress()
+        icon_char, color = get_icon_and_color(node.name, node.is_dir, theme)
+        style = (ord(icon_char), color)
+        if style not in style_ids:
+            style_ids[style] = len(styles)
+            styles.append(style)
+        names.append(node.name)
+        sizes.append(tree_nodes.ends[node.index] - node.index)
+        flags.append((1 if node.is_dir else 4 if node.is_more else 0) | (2 if node.index in previews else 0))
+        kinds.append(style_ids[style])
+
+    data = {'n': names, 's': sizes, 'f': flags, 'k': kinds, 'st': styles}
+    f.write(f'<script type="application/json" id="tree-data">{_json_script(data)}</script>')
+    del data, sizes, flags, kinds
+    if search_index:
+        with stage('search index'):
+            index_json = _json_script(build_search_index(names))
+        f.write(f'<script type="application/json" id="search-index">{index_json}</script>')
+        del index_json
+    del names
+    f.write('<div id="main"><div id="view"><div id="spacer"></div><div id="rows"></div></div><div id="pane" class="preview-container"></div></div>')
+    f.write(VIRTUAL_JS)
+
+    # One data block per preview, only parsed when its file is clicked
+    for index in range(len(tree_nodes)):
+        if index in previews:
+            if on_progress: on_progress()
+            content = previews.get(index)
+            if content:
+                f.write(f'<script type="application/json" id="p-{index}">{_json_script(content)}</script>')
+
+def generate_html(root_path: str, output: Union[str, TextIO], tree_nodes: TreeStore, theme: Dict[str, Any], preview_patterns: Optional[str] = None, on_progress: Optional[Callable[[], None]] = None, preview_cache=None, viewer: str = 'auto', search: str = 'auto'):
+    """
+    Writes the HTML document to `output` (a path or a writable text stream) in a single
+    pass over the tree. Rows are emitted as their previews arrive, so only one preview
+    is held at a time.
+
+    `viewer` is 'static' (every row in the DOM), 'virtual' (tree embedded as JSON, only
+    visible rows rendered) or 'auto' (virtual from VIRTUAL_MIN_ROWS rows). `search` is 'off',
+    'scan', 'index' (prebuilt trigram index, virtual viewer only) or 'auto' (index from
+    SEARCH_INDEX_MIN_ROWS rows).
+    """
+    try:
+        with stage('glyphs'): glyphs = load_glyph_paths()
     except Exception as e:
         print(f"Font error: {e}")
         return
 
-    # Parallel Preview Pass
+    if viewer == 'auto':
+        viewer = 'virtual' if len(tree_nodes) >= VIRTUAL_MIN_ROWS else 'static'
+    if search == 'auto':
+        search = 'index' if len(tree_nodes) >= SEARCH_INDEX_MIN_ROWS else 'scan'
+
     preview_spec = None
     if preview_patterns:
         patterns = [p.strip() for p in preview_patterns.split(",")]
         preview_spec = pathspec.PathSpec.from_lines('gitwildmatch', patterns)
 
-    all_nodes = list(flatten_tree(tree_nodes))
-    to_process = [n.path for n in all_nodes if not n.is_dir and preview_spec and (preview_spec.match_file(n.name) or preview_spec.match_file(n.path))]
-    
-    preview_map = {}
-    if to_process:
-        with ProcessPoolExecutor() as executor:
-            futures = [executor.submit(get_preview_data, path, 'html') for path in to_process]
-            for path, future in zip(to_process, futures):
-                if on_progress: on_progress()
-                res = future.result()
-                if res: preview_map[path] = res
+    to_process = [(n.index, n.path) for n in flatten_tree(tree_nodes) if not n.is_dir and not n.is_more and preview_spec and (preview_spec.match_file(n.name) or preview_spec.match_file(n.path))]
 
     colors, font_cfg = theme.get('colors', {}), theme.get('font', {})
     css = CSS_TEMPLATE.format(bg_color=colors.get('background', '#282c34'), text_file=colors.get('text_file', '#abb2bf'), text_folder=colors.get('text_folder', '#61afef'), line_color=colors.get('lines', '#5c6370'), font_family=font_cfg.get('family', 'monospace'))
+    if viewer == 'virtual':
+        css += VIRTUAL_CSS.format(row_height=VIRTUAL_ROW_HEIGHT)
 
-    icon_defs = '<svg style="display: none;"><defs>'
+    icon_defs = ['<svg style="display: none;"><defs>']
     used_icons = set()
-    def collect_icons(nodes):
-        for node in nodes:
-            char, _ = get_icon_and_color(node.name, node.is_dir, theme)
-            if char not in used_icons:
-                icon_defs_local = f'<symbol id="icon-{ord(char)}" viewBox="0 0 2048 2048"><g transform="scale(1, -1) translate(0, -1700)"><path d="{get_glyph_path(font, char)}" /></g></symbol>'
-                nonlocal icon_defs
-                icon_defs += icon_defs_local
-                used_icons.add(char)
-            if node.children: collect_icons(node.children)
-    collect_icons(tree_nodes)
-    icon_defs += '</defs></svg>'
-
-    content = f"<!DOCTYPE html><html><head><meta charset=\"UTF-8\"><title>Tree: {html.escape(os.path.basename(root_path))}</title>{css}{JS}</head><body>{icon_defs}<h3>{html.escape(os.path.basename(root_path))}</h3><ul class=\"root\">"
-    id_counter = [0]
-    for node in tree_nodes: content += _node_to_html(node, theme, id_counter, preview_map, on_progress)
-    content += "</ul></body></html>"
-    
-    with open(output_path, "w", encoding="utf-8") as f: f.write(content)
+    for node in flatten_tree(tree_nodes):
+        if node.is_more:
+            continue
+        char, _ = get_icon_and_color(node.name, node.is_dir, theme)
+        if char not in used_icons:
+            path_data = glyphs.get(char, "")
+            icon_defs.append(f'<symbol id="icon-{ord(char)}" viewBox="0 0 2048 2048"><g transform="scale(1, -1) translate(0, -1700)"><path d="{path_data}" /></g></symbol>')
+            used_icons.add(char)
+    icon_defs.append('</defs></svg>')
+
+    f = open(output, "w", encoding="utf-8") if isinstance(output, str) else output
+    previews = get_preview_pool().schedule(to_process, 'html', preview_cache, theme.get('preview'))
+    try:
+        title = html.escape(os.path.basename(root_path))
+        script, search_box = (JS if viewer == 'static' else ""), ""
+        if search != 'off':
+            # The static page filters its own DOM; the virtual viewer hooks the box up itself
+            if viewer == 'static':
+                script += SEARCH_JS
+            search_box = SEARCH_BOX.format(attrs=' oninput="searchSoon(this.value)"' if viewer == 'static' else "")
+        f.write(f"<!DOCTYPE html><html><head><meta charset=\"UTF-8\"><title>Tree: {title}</title>{css}{script}</head><body>{''.join(icon_defs)}<h3>{title}</h3>{search_box}")
+        if viewer == 'virtual':
+            _write_virtual(f, tree_nodes, theme, previews, on_progress, search_index=(search == 'index'))
+        else:
+            _write_static(f, tree_nodes, theme, previews, on_progress)
+        f.write("</body></html>")
+    finally:
+        previews.close()
+        if f is not output:
+            f.close()
@@ -1,14 +1,20 @@
 import os
 import sys
-import requests
-from typing import Tuple, Dict, Any
-from fontTools.ttLib import TTFont
-from fontTools.pens.svgPathPen import SVGPathPen
+import json
+import hashlib
+from typing import Tuple, Dict, Any, Optional, TYPE_CHECKING
 
 from .consts import ICONS, EXT_MAP, FONT_URL
 
+if TYPE_CHECKING:
+    from fontTools.ttLib import TTFont
+
 _GLYPH_CACHE = {}
 
+# Prebuilt glyph paths shipped with the package (generated at build time by hatch_build.py,
+# or by `python -m svg_tree.icons`)
+BUNDLED_GLYPH_PACK = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets', 'glyphs.json')
+
 def get_font_path() -> str:
     xdg_config = os.environ.get('XDG_CONFIG_HOME', os.path.join(os.path.expanduser('~'), '.config'))
     return os.path.join(xdg_config, 'svgtree', 'assets', 'SymbolsNerdFont-Regular.ttf')
@@ -19,6 +25,7 @@ def ensure_font_exists():
         os.makedirs(os.path.dirname(font_path), exist_ok=True)
         print(f"Downloading Nerd Font symbols to {font_path}...")
         try:
+            import requests
             r = requests.get(FONT_URL)
             r.raise_for_status()
             with open(font_path, 'wb') as f:
@@ -28,9 +35,10 @@ def ensure_font_exists():
             print(f"Error downloading font: {e}")
             sys.exit(1)
 
-def get_glyph_path(font: TTFont, unicode_char: str) -> str:
+def get_glyph_path(font: 'TTFont', unicode_char: str) -> str:
     if unicode_char in _GLYPH_CACHE:
         return _GLYPH_CACHE[unicode_char]
+    from fontTools.pens.svgPathPen import SVGPathPen
 
     cmap = font.getBestCmap()
     code_point = ord(unicode_char)
@@ -47,6 +55,84 @@ def get_glyph_path(font: TTFont, unicode_char: str) -> str:
     _GLYPH_CACHE[unicode_char] = path_data
     return path_data
 
+def get_glyph_cache_path() -> str:
+    return os.path.join(os.path.dirname(get_font_path()), 'glyph-cache.json')
+
+def _icons_digest() -> str:
+    return hashlib.sha256(json.dumps(ICONS, sort_keys=True).encode('utf-8')).hexdigest()
+
+def _file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _read_json(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_json(path: str, data: Dict[str, Any]):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def build_glyph_pack(font_path: str) -> Dict[str, str]:
+    """Extracts the SVG path of every icon in ICONS from the font."""
+    from fontTools.ttLib import TTFont
+    font = TTFont(font_path)
+    return {char: get_glyph_path(font, char) for char in set(ICONS.values())}
+
+def read_glyph_pack(pack_path: str = BUNDLED_GLYPH_PACK) -> Optional[Dict[str, str]]:
+    """The glyphs of a pack written by `write_glyph_pack`, or None if it is missing or stale."""
+    pack = _read_json(pack_path)
+    if pack and pack.get('icons') == _icons_digest():
+        return pack['glyphs']
+    return None
+
+def write_glyph_pack(font_path: str, pack_path: str = BUNDLED_GLYPH_PACK):
+    os.makedirs(os.path.dirname(pack_path), exist_ok=True)
+    _write_json(pack_path, {'font': _file_digest(font_path), 'icons': _icons_digest(), 'glyphs': build_glyph_pack(font_path)})
+
+def load_glyph_paths() -> Dict[str, str]:
+    """
+    Returns icon char -> SVG path data without parsing the font whenever possible.
+    Lookup order: on-disk cache next to the font (validated by font size/mtime, then hash),
+    the font itself (refreshing the cache), the bundled pack, and finally a font download.
+    """
+    font_path = get_font_path()
+    icons_key = _icons_digest()
+
+    if os.path.exists(font_path):
+        st = os.stat(font_path)
+        cache_path = get_glyph_cache_path()
+        cache = _read_json(cache_path)
+        if cache and cache.get('icons') == icons_key:
+            if cache.get('size') == st.st_size and cache.get('mtime_ns') == st.st_mtime_ns:
+                return cache['glyphs']
+        font_key = _file_digest(font_path)
+        if cache and cache.get('icons') == icons_key and cache.get('font') == font_key:
+            glyphs = cache['glyphs']
+        else:
+            glyphs = build_glyph_pack(font_path)
+        _write_json(cache_path, {'font': font_key, 'icons': icons_key, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'glyphs': glyphs})
+        return glyphs
+
+    glyphs = read_glyph_pack()
+    if glyphs is not None:
+        return glyphs
+
+    ensure_font_exists()
+    return build_glyph_pack(font_path)
+
 def get_icon_and_color(name: str, is_dir: bool, theme: Dict[str, Any]) -> Tuple[str, str]:
     file_colors = theme.get('file_colors', {})
     colors_cfg = theme.get('colors', {})
@@ -68,3 +154,17 @@ def get_icon_and_color(name: str, is_dir: bool, theme: Dict[str, Any]) -> Tuple[
         color = file_colors.get(icon_key, colors_cfg.get('icon_default', '#CCCCCC'))
         
     return icon_char, color
+
+if __name__ == "__main__":
+    # Regenerates the bundled glyph pack: python -m svg_tree.icons [font.ttf] [--download]
+    # Works offline from a local font; the font is only downloaded when --download is given.
+    args = [a for a in sys.argv[1:] if a != '--download']
+    if not args and '--download' in sys.argv[1:]:
+        ensure_font_exists()
+    source = args[0] if args else get_font_path()
+    if not os.path.exists(source):
+        state = "keeping the existing pack" if os.path.exists(BUNDLED_GLYPH_PACK) else "no pack is bundled"
+        print(f"No icon font at {source}; {state} (pass a font path or --download to rebuild it)")
+        sys.exit(0 if os.path.exists(BUNDLED_GLYPH_PACK) else 1)
+    write_glyph_pack(source)
+    print(f"Glyph pack written to {BUNDLED_GLYPH_PACK}")
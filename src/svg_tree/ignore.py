@@ -0,0 +1,130 @@
+import os
+import re
+import pathspec
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Read in every scanned directory; patterns in `.ignore` take precedence over `.gitignore`
+IGNORE_FILES = ('.gitignore', '.ignore')
+
+# pathspec names a group in every pattern; alternations of several patterns must not repeat it
+_NAMED_GROUP = re.compile(r'\(\?P<\w+>')
+
+# (file path, mtime_ns, size) of every ignore file that applies to a directory
+IgnoreKey = Tuple[Tuple[str, int, int], ...]
+
+class _Level:
+    """The patterns of one directory's ignore files (or of `-e`), matched relative to that directory."""
+
+    def __init__(self, base: str, lines: Sequence[str]):
+        self.base = base
+        self.patterns = [(p.regex, p.include) for p in pathspec.PathSpec.from_lines('gitwildmatch', lines).patterns
+                         if p.include is not None]
+        # One regex tells whether any pattern matches; only a hit on a level with negations walks the patterns
+        self.any = re.compile("|".join(f"(?:{_NAMED_GROUP.sub('(?:', regex.pattern)})" for regex, _ in self.patterns))
+        self.negated = not all(include for _, include in self.patterns)
+
+    def match(self, path: str) -> Optional[bool]:
+        """True if `path` is ignored, False if re-included (`!pattern`), None if no pattern matches."""
+        if not self.any.match(path):
+            return None
+        if not self.negated:
+            return True
+        for regex, include in reversed(self.patterns):
+            if regex.match(path):
+                return include
+        return None
+
+class IgnoreRules:
+    """
+    Exclusions for `build_tree`: the `-e` patterns plus, unless `ignore_files` is off, the
+    `.gitignore`/`.ignore` files found from the root down. Paths are matched relative to the
+    root (and to each ignore file's directory), git-style: deeper files override shallower
+    ones, the last matching pattern of a file wins, and `-e` patterns override them all.
+    The rules of each directory are compiled once and shared by its subdirectories.
+    """
+
+    def __init__(self, root_path: str, patterns: Optional[List[str]] = None, ignore_files: bool = True):
+        self.root_path = root_path.rstrip(os.sep) or os.sep
+        self.ignore_files = ignore_files
+        self.exclude = _Level('', patterns) if patterns else None
+        if self.exclude and not self.exclude.patterns:
+            self.exclude = None
+        self._dirs: Dict[str, Tuple[Tuple[_Level, ...], IgnoreKey]] = {}
+
+    def _relative(self, path: str) -> str:
+        rel = path[len(self.root_path):].lstrip(os.sep)
+        return rel.replace(os.sep, '/') if os.sep != '/' else rel
+
+    def _read(self, path: str) -> Tuple[List[str], IgnoreKey]:
+        lines, key = [], []
+        if not self.ignore_files:
+            return lines, ()
+        for name in IGNORE_FILES:
+            file_path = os.path.join(path, name)
+            try:
+                with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+                    st = os.fstat(f.fileno())
+                    lines.extend(f.read().splitlines())
+            except OSError:
+                continue
+            key.append((file_path, st.st_mtime_ns, st.st_size))
+        return lines, tuple(key)
+
+    def _rules(self, path: str) -> Tuple[Tuple[_Level, ...], IgnoreKey]:
+        rules = self._dirs.get(path)
+        if rules is None:
+            if len(path) <= len(self.root_path):
+                levels, key = (), ()
+            else:
+                levels, key = self._rules(os.path.dirname(path))
+            lines, own_key = self._read(path)
+            if own_key:
+                level = _Level(self._relative(path), lines)
+                if level.patterns:
+                    levels = (level,) + levels
+                key += own_key
+            rules = self._dirs[path] = (levels, key)
+        return rules
+
+    def key(self, path: str) -> IgnoreKey:
+        """Identifies the ignore files that apply inside `path`; cached listings are valid while it is unchanged."""
+        return self._rules(path)[1]
+
+    def matcher(self, path: str) -> Optional[Callable[[str, bool], bool]]:
+        """Returns `ignored(name, is_dir)` for the entries of directory `path`, or None if nothing applies."""
+        levels = self._rules(path)[0]
+        exclude = self.exclude
+        if not levels and not exclude:
+            return None
+        rel = self._relative(path)
+        prefix = rel + '/' if rel else ''
+        # Entry paths relative to each level's directory, deepest level first
+        scoped = [(level, prefix[len(level.base) + 1 if level.base else 0:]) for level in levels]
+
+        def ignored(name: str, is_dir: bool) -> bool:
+            suffix = name + '/' if is_dir else name
+            if exclude:
+                result = exclude.match(prefix + suffix)
+                if result is not None:
+                    return result
+            for level, level_prefix in scoped:
+                result = level.match(level_prefix + suffix)
+                if result is not None:
+                    return result
+            return False
+        return ignored
+
+    def refresh(self, path: str) -> bool:
+        """Re-reads the ignore files of `path`; if they changed, drops the compiled rules of it and its subdirectories."""
+        rules = self._dirs.get(path)
+        if rules is None:
+            return False
+        if self._read(path)[1] == tuple(k for k in rules[1] if os.path.dirname(k[0]) == path):
+            return False
+        for dir_path in [p for p in self._dirs if p == path or p.startswith(path + os.sep)]:
+            del self._dirs[dir_path]
+        return True
+
+    def files(self) -> List[str]:
+        """Paths of the ignore files read so far."""
+        return sorted({k[0] for _, key in self._dirs.values() for k in key})
@@ -1,14 +1,13 @@
+import io
 import os
 import argparse
 import sys
-import pathspec
 import itertools
 
 from .config import load_theme
 from .core import build_tree
-from .render import generate_svg
-from .html import generate_html
-from .export import export_png
+from .ignore import IgnoreRules
+from . import profiling
 
 def main():
     parser = argparse.ArgumentParser(description="Generate a pretty SVG tree of a directory.")
@@ -16,42 +15,124 @@ def main():
     parser.add_argument("-o", "--output", default="tree.svg", help="Output file path")
     parser.add_argument("-d", "--depth", type=int, default=2, help="Max recursion depth (default: 2)")
     parser.add_argument("-e", "--exclude", help="Comma-separated exclude patterns (e.g. '*.jpg, .git')")
+    parser.add_argument("--max-entries", type=int, default=0, metavar="N", help="Show at most N entries per directory and fold the rest into a summary row (default: 0 = all)")
+    parser.add_argument("--no-ignore", action="store_true", help="Don't read .gitignore/.ignore files (only -e patterns exclude entries)")
     parser.add_argument("-s", "--size", type=int, default=1, choices=range(1, 9), help="PNG Scale factor (1-8x)")
     parser.add_argument("-p", "--file-preview", help="Preview content of files matching patterns (e.g. '*.py, README.md')")
     parser.add_argument("--png", action="store_true", help="Generate PNG output instead of SVG")
+    parser.add_argument("--tiled", action="store_true", help="Rasterize PNGs in horizontal bands with CairoSVG to bound memory (default: only for very large images)")
     parser.add_argument("--html", action="store_true", help="Generate HTML output instead of SVG")
+    parser.add_argument("--html-viewer", choices=["auto", "static", "virtual"], default="auto", help="HTML viewer: every row in the page, or a virtualized list for huge trees (default: auto)")
+    parser.add_argument("--html-search", choices=["auto", "index", "scan", "off"], default="auto", help="HTML search box: prebuilt trigram index, linear scan, or none (default: auto, indexes huge trees)")
     parser.add_argument("--theme", help="Path to a custom TOML theme file")
+    parser.add_argument("--svg-optimize", action="store_true", help="Write smaller SVG that rasterizes faster: merged tree lines, CSS classes, merged code spans, trimmed numbers (a .svgz output is gzipped either way)")
+    parser.add_argument("--svg-backend", choices=["auto", "stream", "svgwrite"], default="auto", help="SVG writer: stream rows to disk or build an svgwrite DOM (default: auto, streams large trees)")
+    parser.add_argument("--page-rows", type=int, default=0, help="Split SVG/PNG output into pages of at most this many rows, plus an HTML index (default: 0, one file)")
+    parser.add_argument("--split-by", choices=["rows", "subtree"], default="rows", help="With --page-rows: break pages anywhere, or prefer top-level subtree boundaries (default: rows)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of parallel directory scan workers (default: 1)")
+    parser.add_argument("--scan-cache", action="store_true", help="Reuse directory listings from previous runs for directories whose mtime is unchanged")
+    parser.add_argument("--preview-cache", action="store_true", help="Reuse file previews from previous runs for unchanged files")
+    parser.add_argument("--preview-cache-size", type=int, default=512, help="Preview cache size limit in MB (default: 512)")
+    parser.add_argument("--snapshot-out", metavar="PATH", help="Save the scanned tree as a snapshot (NDJSON, or binary for .svgtree; add .gz to compress)")
+    parser.add_argument("--from-snapshot", metavar="PATH", help="Render a snapshot instead of scanning the filesystem (root, depth and excludes come from the snapshot)")
+    parser.add_argument("--watch", action="store_true", help="Keep running and re-render (SVG/HTML/PNG) when the tree or a previewed file changes")
+    parser.add_argument("--watch-debounce", type=int, default=200, metavar="MS", help="Quiet time that ends a burst of changes before re-rendering (default: 200)")
+    parser.add_argument("--watch-poll", type=float, metavar="SECONDS", help="Poll for changes at this interval instead of using inotify")
+    parser.add_argument("--profile", action="store_true", help="Print per-stage timings, counts, peak memory and the slowest previews after the run")
+    parser.add_argument("--profile-json", metavar="PATH", help="Also write the --profile report as JSON to PATH (implies --profile)")
+    parser.add_argument("--profile-top", type=int, default=10, metavar="N", help="Number of slowest previews to report (default: 10)")
+    parser.add_argument("--profile-cprofile", metavar="PATH", help="Dump cProfile stats for the whole run to PATH (readable with pstats or snakeviz)")
     
     args = parser.parse_args()
+
+    profiler = None
+    if args.profile or args.profile_json:
+        profiler = profiling.start_profiler(slowest=max(0, args.profile_top))
+    cprofile = None
+    if args.profile_cprofile:
+        import cProfile
+        cprofile = cProfile.Profile()
+        cprofile.enable()
     
     root = os.path.abspath(args.root)
+    args.max_entries = max(0, args.max_entries)
     theme = load_theme(args.theme)
     
-    spec = None
+    patterns = []
     if args.exclude:
         patterns = [p.strip() for p in args.exclude.split(",")]
-        spec = pathspec.PathSpec.from_lines('gitwildmatch', patterns)
+    ignore = IgnoreRules(root, patterns, ignore_files=not args.no_ignore) if patterns or not args.no_ignore else None
+
+    scan_cache = None
+    if args.scan_cache:
+        from .cache import ScanCache
+        scan_cache = ScanCache.load(root, patterns, args.max_entries)
+    listings = scan_cache
+    if args.watch:
+        # Listings and previews stay in memory so a change only re-reads what it touched
+        from .watch import ListingCache
+        listings = ListingCache(scan_cache)
         
     # Progress indicator setup
     spinner_chars = itertools.cycle(['⠋', '⠙', '⠹', '⠸', '⠼', '⠴', '⠦', '⠧', '⠇', '⠏'])
     count = 0
-    
-    def on_progress():
-        nonlocal count
-        count += 1
-        if count % 5 == 0:  # Update every 5 items to reduce I/O overhead
-            sys.stdout.write(f"\rScanning {root} (depth={args.depth})... {next(spinner_chars)}  ({count} items found)")
-            sys.stdout.flush()
 
-    # Initial print
-    sys.stdout.write(f"Scanning {root} (depth={args.depth})... {next(spinner_chars)}")
-    sys.stdout.flush()
+    if args.from_snapshot:
+        if args.watch:
+            print("Error: --watch needs a directory to scan, not a snapshot")
+            sys.exit(1)
+        from .snapshot import read_snapshot
+        try:
+            with profiling.stage('snapshot'):
+                nodes = read_snapshot(args.from_snapshot)
+        except (OSError, ValueError) as e:
+            print(f"Error: could not read snapshot {args.from_snapshot}: {e}")
+            sys.exit(1)
+        root = nodes.root_path
+        profiling.count('snapshot', items=len(nodes), bytes_read=profiling.output_size(args.from_snapshot))
+        print(f"Loaded {len(nodes)} entries of {root} from {args.from_snapshot}")
+    else:
+        def on_progress():
+            nonlocal count
+            count += 1
+            if count % 5 == 0:  # Update every 5 items to reduce I/O overhead
+                sys.stdout.write(f"\rScanning {root} (depth={args.depth})... {next(spinner_chars)}  ({count} items found)")
+                sys.stdout.flush()
+
+        # Initial print
+        sys.stdout.write(f"Scanning {root} (depth={args.depth})... {next(spinner_chars)}")
+        sys.stdout.flush()
     
-    nodes = build_tree(root, args.depth, spec, on_progress=on_progress)
+        with profiling.stage('scan'):
+            nodes = build_tree(root, args.depth, ignore, on_progress=on_progress, jobs=max(1, args.jobs), cache=listings, max_entries=args.max_entries)
+        profiling.count('scan', items=len(nodes))
+        cache_note = ""
+        if scan_cache:
+            scan_cache.save()
+            cache_note = f", {scan_cache.hits} of {scan_cache.hits + scan_cache.misses} dirs cached"
     
-    # Finalize scanning progress bar
-    sys.stdout.write(f"\rScanning {root} (depth={args.depth})... Done! ({count} items found)   \n")
-    sys.stdout.flush()
+        # Finalize scanning progress bar
+        sys.stdout.write(f"\rScanning {root} (depth={args.depth})... Done! ({count} items found{cache_note})   \n")
+        sys.stdout.flush()
+
+    if args.snapshot_out:
+        from .snapshot import write_snapshot
+        meta = None if args.from_snapshot else {'depth': args.depth, 'exclude': patterns, 'ignore_files': not args.no_ignore, 'max_entries': args.max_entries}
+        with profiling.stage('snapshot'):
+            size = write_snapshot(nodes, args.snapshot_out, meta)
+        profiling.count('snapshot', items=len(nodes), bytes_written=size)
+        print(f"Snapshot written to: {args.snapshot_out} ({len(nodes)} entries, {size} bytes)")
+
+    preview_cache = None
+    if args.preview_cache and args.file_preview:
+        from .cache import PreviewCache
+        preview_cache = PreviewCache(max_bytes=args.preview_cache_size * 1024 * 1024)
+    row_cache = None
+    if args.watch:
+        from .watch import MemoryPreviewCache
+        if args.file_preview:
+            preview_cache = MemoryPreviewCache(preview_cache)
+        row_cache = {}
 
     # Reuse spinner for rendering
     render_count = 0
@@ -62,40 +143,87 @@ def main():
             sys.stdout.write(f"\rGenerating output... {next(spinner_chars)} ({render_count} steps)")
             sys.stdout.flush()
 
-    sys.stdout.write(f"Generating output... {next(spinner_chars)}")
-    sys.stdout.flush()
-    
-    if args.html:
-        out = args.output
-        if out.endswith('.svg') or out.endswith('.png'):
-            out = os.path.splitext(out)[0] + ".html"
-        generate_html(root, out, nodes, theme, preview_patterns=args.file_preview, on_progress=on_render_progress)
+    def render(nodes):
+        nonlocal render_count
+        render_count = 0
+
+        sys.stdout.write(f"Generating output... {next(spinner_chars)}")
+        sys.stdout.flush()
+
+        # Output backends are imported on demand so a run only loads the dependencies it uses
+        if args.html:
+            from .html import generate_html
+            out = args.output
+            if out.endswith(('.svg', '.svgz', '.png')):
+                out = os.path.splitext(out)[0] + ".html"
+            with profiling.stage('html'):
+                generate_html(root, out, nodes, theme, preview_patterns=args.file_preview, on_progress=on_render_progress, preview_cache=preview_cache, viewer=args.html_viewer, search=args.html_search)
+            profiling.count('html', items=len(nodes), bytes_written=profiling.output_size(out))
         
-    elif args.png:
-        # Handle PNG output exclusively
-        final_out = args.output
-        if final_out.endswith('.svg'):
-            final_out = os.path.splitext(final_out)[0] + ".png"
+        elif args.png:
+            from .render import generate_svg, page_path, write_page_index
+            from .export import export_png
+            # Handle PNG output exclusively
+            final_out = args.output
+            if final_out.endswith(('.svg', '.svgz')):
+                final_out = os.path.splitext(final_out)[0] + ".png"
             
-        # Create temp SVG path
-        svg_tmp = final_out + ".tmp.svg"
-        
-        # Generate SVG
-        generate_svg(root, svg_tmp, nodes, theme, save_png=False, preview_patterns=args.file_preview, on_progress=on_render_progress)
-        
-        # Convert
-        export_png(svg_tmp, final_out, args.size)
-        
-        # Cleanup
-        if os.path.exists(svg_tmp):
-            os.remove(svg_tmp)
+            pages = []
+
+            # The SVG is rendered into memory and each page is rasterized as soon as it is complete.
+            # Several pages, or the re-renders of --watch, share one Inkscape shell; a lone page is piped to Inkscape.
+            def on_png_page(page, page_count, svg_page, label):
+                png_page = page_path(final_out, page, page_count) if page_count > 1 else final_out
+                with profiling.stage('png'):
+                    export_png(svg_page.getvalue(), png_page, args.size, batch=page_count > 1 or args.watch, tiled=True if args.tiled else None)
+                profiling.count('png', items=1, bytes_written=profiling.output_size(png_page))
+                if page_count > 1:
+                    pages.append((png_page, label))
+                    write_page_index(os.path.splitext(final_out)[0] + "-index.html", os.path.basename(root), pages, theme.get('colors', {}).get('background', '#282c34'))
+
+            with profiling.stage('svg'):
+                written = generate_svg(root, io.BytesIO(), nodes, theme, save_png=False, preview_patterns=args.file_preview, on_progress=on_render_progress, backend=args.svg_backend, preview_cache=preview_cache, page_rows=args.page_rows, split_by=args.split_by, on_page=on_png_page, row_cache=row_cache, optimize=args.svg_optimize, font_flavor='sfnt')
+            profiling.count('svg', items=len(nodes), bytes_written=sum(profiling.output_size(path) for path, _ in written))
             
-    else:
-        # Standard SVG output
-        generate_svg(root, args.output, nodes, theme, save_png=False, preview_patterns=args.file_preview, on_progress=on_render_progress)
+        else:
+            from .render import generate_svg, write_page_index
+            pages = []
+
+            # Keep the index current so finished pages can be published while later ones render
+            def on_svg_page(page, page_count, path, label):
+                if page_count > 1:
+                    pages.append((path, label))
+                    write_page_index(os.path.splitext(args.output)[0] + "-index.html", os.path.basename(root), pages, theme.get('colors', {}).get('background', '#282c34'))
+
+            # Standard SVG output
+            with profiling.stage('svg'):
+                written = generate_svg(root, args.output, nodes, theme, save_png=False, preview_patterns=args.file_preview, on_progress=on_render_progress, backend=args.svg_backend, preview_cache=preview_cache, page_rows=args.page_rows, split_by=args.split_by, on_page=on_svg_page, row_cache=row_cache, optimize=args.svg_optimize)
+            profiling.count('svg', items=len(nodes), bytes_written=sum(profiling.output_size(path) for path, _ in written))
+
+        sys.stdout.write("\rGenerating output... Done!                                         \n")
+        sys.stdout.flush()
+
+    render(nodes)
+    if args.watch:
+        from .watch import watch
+        watch(root, args.depth, ignore, nodes, listings, render, preview_patterns=args.file_preview, preview_cache=preview_cache, jobs=max(1, args.jobs), debounce=args.watch_debounce / 1000, poll_interval=args.watch_poll, max_entries=args.max_entries)
+
+    if preview_cache:
+        preview_cache.close()
+
 
-    sys.stdout.write("\rGenerating output... Done!                                         \n")
-    sys.stdout.flush()
+    if cprofile:
+        cprofile.disable()
+        cprofile.dump_stats(args.profile_cprofile)
+        print(f"cProfile stats written to: {args.profile_cprofile}")
+    if profiler:
+        report = profiler.report()
+        print(profiling.format_report(report))
+        if args.profile_json:
+            import json
+            with open(args.profile_json, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            print(f"Profile written to: {args.profile_json}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,244 @@
+import os
+import atexit
+import pickle
+import signal
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import wait, FIRST_COMPLETED
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from .cache import MISS, file_stamp
+from .preview import get_preview_data, preview_settings_key
+from . import profiling
+
+# Results whose pickled form exceeds this are handed back through a temp file
+SPILL_BYTES = 1024 * 1024
+# Finished but not yet consumed results are kept in memory up to this total; later ones are spilled too
+BUFFER_BYTES = 64 * 1024 * 1024
+# Small files are batched into one task until either limit is reached
+CHUNK_FILES = 16
+CHUNK_BYTES = 4 * 1024 * 1024
+
+class _Spilled:
+    """Placeholder for a result that was written to a temp file."""
+    __slots__ = ('path',)
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @classmethod
+    def write(cls, data: bytes) -> '_Spilled':
+        fd, tmp_path = tempfile.mkstemp(prefix='svgtree-preview-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        return cls(tmp_path)
+
+    def load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                return pickle.load(f)
+        finally:
+            self.discard()
+
+    def discard(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+class _Cached:
+    """Placeholder for a preview cache hit, loaded when it is consumed."""
+    __slots__ = ('found',)
+
+    def __init__(self, found):
+        self.found = found
+
+def _init_worker():
+    # Forked workers inherit tracemalloc from a profiled parent; tracing them would only slow them down
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    # Ctrl+C is handled by the parent, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _run_chunk(chunk: List[Tuple[Hashable, str, str]], settings: Optional[Dict[str, Any]] = None, stamp: bool = False) -> List[Tuple[Hashable, Any, float, int, Any]]:
+    out = []
+    for key, path, mode in chunk:
+        # Hashed here rather than in the parent so a cold preview cache doesn't serialize the reads
+        file = file_stamp(path) if stamp else None
+        start = time.perf_counter()
+        result = get_preview_data(path, mode, settings)
+        seconds = time.perf_counter() - start
+        data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > SPILL_BYTES:
+            out.append((key, _Spilled.write(data), seconds, 0, file))
+        else:
+            out.append((key, result, seconds, len(data), file))
+    return out
+
+class PreviewPool:
+    """
+    Long-lived process pool for preview extraction, shared by every render in the process
+    (see `get_preview_pool`). Work is submitted in chunks with a bounded number in flight.
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_in_flight = self.workers * 2
+        self._executor = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def schedule(self, tasks: List[Tuple[Hashable, str]], mode: str, preview_cache=None, settings: Optional[Dict[str, Any]] = None) -> 'PreviewBatch':
+        return PreviewBatch(self, tasks, mode, preview_cache, settings)
+
+_POOL: Optional[PreviewPool] = None
+
+def get_preview_pool() -> PreviewPool:
+    global _POOL
+    if _POOL is None:
+        _POOL = PreviewPool()
+        atexit.register(_POOL.shutdown)
+    return _POOL
+
+class PreviewBatch:
+    """
+    Previews for one render. Files are scheduled largest first, but `get` bumps the chunk
+    holding the requested key so in-order consumers are never starved. Results that arrive
+    before they are needed are kept in memory up to BUFFER_BYTES in total and spilled to temp
+    files beyond it (large ones stay in their temp file either way); preview cache hits are
+    only loaded when consumed.
+    """
+
+    def __init__(self, pool: PreviewPool, tasks: List[Tuple[Hashable, str]], mode: str, preview_cache=None, settings: Optional[Dict[str, Any]] = None):
+        self.pool = pool
+        self.mode = mode
+        self.preview_cache = preview_cache
+        self.settings = settings
+        self.settings_key = preview_settings_key(mode, settings)
+        self._paths: Dict[Hashable, str] = {}
+        self._done: Dict[Hashable, Any] = {}
+        self._cached = set()
+        self._chunk_of: Dict[Hashable, int] = {}
+        self._running: Dict[Any, int] = {}
+        self._submitted = set()
+        self._seconds: Dict[Hashable, float] = {}
+        self._sizes: Dict[Hashable, int] = {}
+        self._nbytes: Dict[Hashable, int] = {}
+        self._stamps: Dict[Hashable, Any] = {}
+        self._buffered = 0
+
+        sized = []
+        for key, path in tasks:
+            self._paths[key] = path
+            if preview_cache:
+                found = preview_cache.find(path, self.settings_key)
+                if found is not None:
+                    self._done[key] = _Cached(found)
+                    self._cached.add(key)
+                    continue
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = 0
+            self._sizes[key] = size
+            sized.append((size, key, path))
+        sized.sort(key=lambda t: t[0], reverse=True)
+
+        self._chunks: List[List[Tuple[Hashable, str, str]]] = []
+        chunk, chunk_bytes = [], 0
+        for size, key, path in sized:
+            if chunk and (len(chunk) >= CHUNK_FILES or chunk_bytes + size > CHUNK_BYTES):
+                self._chunks.append(chunk)
+                chunk, chunk_bytes = [], 0
+            chunk.append((key, path, mode))
+            chunk_bytes += size
+        if chunk:
+            self._chunks.append(chunk)
+        for i, c in enumerate(self._chunks):
+            for key, _, _ in c:
+                self._chunk_of[key] = i
+        self._next_chunk = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._paths
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    def _submit(self, chunk_id: int):
+        self._submitted.add(chunk_id)
+        self._running[self.pool.executor.submit(_run_chunk, self._chunks[chunk_id], self.settings, bool(self.preview_cache and self.preview_cache.needs_stamps))] = chunk_id
+
+    def _pump(self, needed: int):
+        if needed not in self._submitted:
+            self._submit(needed)
+        while len(self._running) < self.pool.max_in_flight and self._next_chunk < len(self._chunks):
+            if self._next_chunk not in self._submitted:
+                self._submit(self._next_chunk)
+            self._next_chunk += 1
+        done, _ = wait(list(self._running), return_when=FIRST_COMPLETED)
+        for future in done:
+            del self._running[future]
+            for key, value, seconds, nbytes, stamp in future.result():
+                if nbytes and self._buffered + nbytes > BUFFER_BYTES:
+                    value, nbytes = _Spilled.write(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)), 0
+                self._done[key] = value
+                self._seconds[key] = seconds
+                if stamp:
+                    self._stamps[key] = stamp
+                if nbytes:
+                    self._nbytes[key] = nbytes
+                    self._buffered += nbytes
+
+    def get(self, key: Hashable):
+        """Returns the preview for `key`, waiting for (and prioritising) it if needed."""
+        if key not in self._done:
+            with profiling.stage('preview wait'):
+                while key not in self._done:
+                    self._pump(self._chunk_of[key])
+        value = self._done.pop(key)
+        self._buffered -= self._nbytes.pop(key, 0)
+        if isinstance(value, _Spilled):
+            value = value.load()
+        elif isinstance(value, _Cached):
+            value = self.preview_cache.load(value.found)
+            if value is MISS:
+                # Evicted since the batch was scheduled
+                self._cached.discard(key)
+                value = get_preview_data(self._paths[key], self.mode, self.settings)
+        profiler = profiling.get_profiler()
+        if profiler:
+            profiler.preview(self._paths[key], profiling.preview_kind(value), self._seconds.get(key), self._sizes.get(key, 0))
+        self._seconds.pop(key, None)
+        if self.preview_cache and key not in self._cached:
+            self.preview_cache.put(self._paths[key], self.settings_key, value, self._stamps.pop(key, None))
+        return value
+
+    def close(self):
+        """Drops unconsumed results, including spilled temp files."""
+        for future in self._running:
+            future.cancel()
+        for future in wait(list(self._running)).done:
+            if not future.cancelled() and future.exception() is None:
+                for _, value, _, _, _ in future.result():
+                    if isinstance(value, _Spilled):
+                        value.discard()
+        for value in self._done.values():
+            if isinstance(value, _Spilled):
+                value.discard()
+        self._running.clear()
+        self._done.clear()
+        self._nbytes.clear()
+        self._stamps.clear()
+        self._buffered = 0
@@ -1,14 +1,12 @@
 import os
 import html
 import base64
+import io
+import json
 import mimetypes
-import svgwrite
 import re
-from PIL import Image
-from pygments import highlight
-from pygments.lexers import get_lexer_for_filename, TextLexer
-from pygments.formatters import HtmlFormatter
-from pygments.styles import get_style_by_name
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
 
 # Register extra mime types
 mimetypes.add_type("image/jxl", ".jxl")
@@ -22,6 +20,29 @@ mimetypes.add_type("audio/wav", ".wav")
 CODE_FONT_SIZE = 12
 LINE_HEIGHT = 16
 MAX_PREVIEW_SIZE = 999 * 1024 * 1024 
+PREVIEW_STYLE = 'monokai'
+DEFAULT_CODE_COLOR = 'abb2bf'
+# Bump when the shape of preview results changes, invalidating persisted previews
+PREVIEW_CACHE_VERSION = 4
+
+# Defaults for the theme's [preview] section
+DEFAULT_PREVIEW_SETTINGS = {
+    'image_max_width': 400,
+    'image_max_height': 300,
+    'image_format': 'auto',  # auto, png, jpeg or webp
+    'max_lines': 60,         # 0 = whole file
+    'max_columns': 160,      # 0 = no limit
+    'lines': 'head',         # 'head' or a 1-based range such as '120-180'
+    'style': PREVIEW_STYLE,  # pygments style of code previews
+}
+TRUNCATION_COLOR = '#5c6370'
+# Images that already fit the preview box are embedded as-is below this size
+_THUMBNAIL_PASSTHROUGH_BYTES = 512 * 1024
+_PASSTHROUGH_FORMATS = {'PNG': 'image/png', 'JPEG': 'image/jpeg', 'GIF': 'image/gif', 'WEBP': 'image/webp'}
+_JPEG_QUALITY = 85
+_IMAGE_FORMATS = ('auto', 'png', 'jpeg', 'webp')
+# Per-process token color tables, see _token_colors
+_STYLE_COLORS: Dict[str, '_StyleColors'] = {}
 
 # XML-compatible character filter
 _RE_XML_ILLEGAL = re.compile(
@@ -38,41 +59,63 @@ def sanitize_text(text: str) -> str:
         text = str(text)
     return _RE_XML_ILLEGAL.sub('', text)
 
-def _get_token_lines(tokens):
+class _StyleColors(dict):
+    """Token type -> '#rrggbb' for one pygments style; misses are resolved through the style."""
+
+    def __init__(self, style):
+        super().__init__()
+        self.style = style
+
+    def __missing__(self, ttype):
+        try:
+            color = '#' + (self.style.style_for_token(ttype)['color'] or DEFAULT_CODE_COLOR)
+        except Exception:
+            color = '#' + DEFAULT_CODE_COLOR
+        self[ttype] = color
+        return color
+
+def _token_colors(style_name: str) -> _StyleColors:
+    """
+    Token type -> '#rrggbb' table of a pygments style, built once per process (each preview
+    worker keeps its own). Token types the style does not list are resolved on first use.
+    Unknown style names fall back to PREVIEW_STYLE.
+    """
+    colors = _STYLE_COLORS.get(style_name)
+    if colors is None:
+        from pygments.styles import get_style_by_name
+        from pygments.util import ClassNotFound
+        try:
+            style = get_style_by_name(style_name)
+        except ClassNotFound:
+            style = get_style_by_name(PREVIEW_STYLE)
+        colors = _STYLE_COLORS[style_name] = _StyleColors(style)
+        colors.update((ttype, '#' + (ndef['color'] or DEFAULT_CODE_COLOR)) for ttype, ndef in style)
+    return colors
+
+def _token_lines(tokens, colors: Dict[Any, str]) -> List[List[Tuple[str, str]]]:
     """
-    Processes a stream of (ttype, value) tokens and groups them into lines.
-    Handles internal newlines in token values and flattens any nested structures.
+    Splits a stream of (ttype, value) tokens into lines of (color, text) runs. Adjacent
+    tokens of the same color share a run, and whitespace joins whatever run it touches.
     """
     lines = []
-    current_line = []
-    
-    def process_token(ttype, value):
-        nonlocal current_line
-        if isinstance(value, (list, tuple)):
-            for sub_t in value:
-                if isinstance(sub_t, (list, tuple)) and len(sub_t) == 2:
-                    process_token(sub_t[0], sub_t[1])
-            return
-
-        val_str = str(value)
-        if '\n' in val_str:
-            parts = val_str.split('\n')
-            for i, part in enumerate(parts):
-                if part:
-                    current_line.append((ttype, part))
-                if i < len(parts) - 1:
-                    lines.append(current_line)
-                    current_line = []
-        else:
-            if val_str:
-                current_line.append((ttype, val_str))
-
-    for t in tokens:
-        if isinstance(t, (list, tuple)) and len(t) == 2:
-            process_token(t[0], t[1])
-            
-    if current_line:
-        lines.append(current_line)
+    runs = []
+    for ttype, value in tokens:
+        color = colors[ttype]
+        parts = value.split('\n') if '\n' in value else (value,)
+        for i, part in enumerate(parts):
+            if i:
+                lines.append([tuple(run) for run in runs])
+                runs = []
+            if not part:
+                continue
+            if runs and (runs[-1][0] == color or part.isspace()):
+                runs[-1][1] += part
+            elif runs and runs[-1][1].isspace():
+                runs[-1] = [color, runs[-1][1] + part]
+            else:
+                runs.append([color, part])
+    if runs:
+        lines.append([tuple(run) for run in runs])
     return lines
 
 def is_binary(file_path):
@@ -90,47 +133,195 @@ def _read_b64(file_path):
     with open(file_path, "rb") as f:
         return base64.b64encode(f.read()).decode("utf-8")
 
-def _read_text_preview(file_path: str) -> str:
-    """Reads the entire text file content within MAX_PREVIEW_SIZE."""
+def _format_bytes(n: int) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if n < 1024 or unit == 'GB':
+            return f"{n:.0f} {unit}" if unit == 'B' else f"{n:.1f} {unit}"
+        n /= 1024
+
+def _parse_line_window(settings: Dict[str, Any]) -> Tuple[int, int]:
+    """Returns the 1-based first line and the maximum number of lines (0 = unbounded)."""
+    max_lines = int(settings.get('max_lines') or 0)
+    first = 1
+    window = str(settings.get('lines') or 'head').strip()
+    if window != 'head':
+        start, _, end = window.partition('-')
+        try:
+            first = max(1, int(start))
+            count = int(end) - first + 1 if end.strip() else 0
+        except ValueError:
+            count = -1
+        if count < 0 or (end.strip() and count == 0):
+            raise ValueError(f"invalid [preview] lines = {window!r}: expected \"head\" or a range like \"120-180\"")
+        if count:
+            max_lines = min(max_lines, count) if max_lines else count
+    return first, max_lines
+
+def validate_preview_settings(settings: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Checks a theme's [preview] section when it is loaded, so bad values are reported once
+    instead of silently emptying every preview. Invalid entries are replaced by their
+    defaults with a warning.
+    """
+    # The image box has to be at least 1px; line and column limits may be 0 (unbounded)
+    for key, minimum in (('image_max_width', 1), ('image_max_height', 1), ('max_lines', 0), ('max_columns', 0)):
+        if key in settings:
+            try:
+                if int(settings[key]) < minimum:
+                    raise ValueError
+            except (TypeError, ValueError):
+                print(f"Warning: invalid [preview] {key} = {settings[key]!r}, using {DEFAULT_PREVIEW_SETTINGS[key]}")
+                settings[key] = DEFAULT_PREVIEW_SETTINGS[key]
+    if 'image_format' in settings and str(settings['image_format']).lower() not in _IMAGE_FORMATS:
+        print(f"Warning: invalid [preview] image_format = {settings['image_format']!r}: expected one of {', '.join(_IMAGE_FORMATS)}; using {DEFAULT_PREVIEW_SETTINGS['image_format']!r}")
+        settings['image_format'] = DEFAULT_PREVIEW_SETTINGS['image_format']
+    try:
+        _parse_line_window(resolve_preview_settings(settings))
+    except ValueError as e:
+        print(f"Warning: {e}; using \"head\"")
+        settings['lines'] = 'head'
+    return settings
+
+def _read_text_window(file_path: str, settings: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    Streams only the configured window of a text file (see DEFAULT_PREVIEW_SETTINGS) and
+    returns (text, truncation note). Over-long lines are cut and marked with an ellipsis;
+    the note describes what was left out ("" if nothing).
+    """
     try:
-        if os.path.getsize(file_path) > MAX_PREVIEW_SIZE:
-            return ""
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            return sanitize_text(f.read())
+        first, max_lines = _parse_line_window(settings)
+        max_columns = int(settings.get('max_columns') or 0)
+        if not max_lines and os.path.getsize(file_path) > MAX_PREVIEW_SIZE:
+            return "", ""
+        # Bytes per line read in one go; the rest of a longer line is skipped in chunks
+        read_limit = max_columns * 4 + 2 if max_columns else -1
+        lines = []
+        with open(file_path, 'rb') as f:
+            def read_line():
+                raw = f.readline(read_limit)
+                if not raw:
+                    return None
+                cut = False
+                if not raw.endswith(b'\n') and read_limit > 0 and len(raw) == read_limit:
+                    cut = True
+                    while True:
+                        rest = f.readline(1 << 16)
+                        if not rest or rest.endswith(b'\n'):
+                            break
+                text = raw.rstrip(b'\r\n').decode('utf-8', errors='ignore')
+                if max_columns and len(text) > max_columns:
+                    text, cut = text[:max_columns], True
+                return text + '…' if cut else text
+
+            for _ in range(first - 1):
+                if read_line() is None:
+                    break
+            while not max_lines or len(lines) < max_lines:
+                line = read_line()
+                if line is None:
+                    break
+                lines.append(line)
+            pos = f.tell()
+            remaining = os.fstat(f.fileno()).st_size - pos if f.read(1) else 0
+
+        notes = []
+        if first > 1:
+            notes.append(f"lines 1-{first - 1} skipped")
+        if remaining:
+            notes.append(f"{_format_bytes(remaining)} more")
+        note = f"… {', '.join(notes)}" if notes else ""
+        return sanitize_text("\n".join(lines)), note
     except Exception:
-        return ""
+        return "", ""
+
+def resolve_preview_settings(settings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    return {**DEFAULT_PREVIEW_SETTINGS, **(settings or {})}
+
+def preview_settings_key(mode: str, settings: Optional[Dict[str, Any]] = None) -> str:
+    """Identifies everything besides the file itself that a preview result depends on."""
+    return f"v{PREVIEW_CACHE_VERSION}:{mode}:{json.dumps(resolve_preview_settings(settings), sort_keys=True)}"
 
-def get_preview_data(file_path: str, mode: str = 'svg'):
+def make_thumbnail(file_path: str, settings: Dict[str, Any]) -> Optional[Tuple[int, int, str, str]]:
+    """
+    Returns (width, height, mime, base64 data) of the image downscaled to fit the preview box,
+    or None if Pillow cannot read it. Small images that already fit are passed through.
+    """
+    from PIL import Image
+    max_w, max_h = max(1, int(settings['image_max_width'])), max(1, int(settings['image_max_height']))
+    try:
+        img = Image.open(file_path)
+    except Exception:
+        return None
+    with img:
+        w, h = img.size
+        src_format, src_size = img.format, os.path.getsize(file_path)
+        if w <= max_w and h <= max_h and src_format in _PASSTHROUGH_FORMATS and src_size <= _THUMBNAIL_PASSTHROUGH_BYTES:
+            return w, h, _PASSTHROUGH_FORMATS[src_format], _read_b64(file_path)
+
+        # JPEG can decode straight at a reduced scale; thumbnail() then uses reduce() before resampling
+        if img.format == 'JPEG':
+            img.draft('RGB', (max_w, max_h))
+        img.thumbnail((max_w, max_h), reducing_gap=2.0)
+
+        has_alpha = img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+        fmt = str(settings.get('image_format', 'auto')).lower()
+        if fmt == 'auto':
+            # Photos compress well as JPEG; keep PNG for transparency and flat/paletted artwork
+            fmt = 'png' if has_alpha or img.mode in ('P', '1') else 'jpeg'
+        if fmt == 'jpeg':
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+        elif img.mode not in ('RGB', 'RGBA', 'L', 'LA', 'P'):
+            img = img.convert('RGBA' if has_alpha else 'RGB')
+
+        buf = io.BytesIO()
+        if fmt == 'jpeg':
+            img.save(buf, format='JPEG', quality=_JPEG_QUALITY, optimize=True)
+        elif fmt == 'webp':
+            img.save(buf, format='WEBP', quality=_JPEG_QUALITY)
+        else:
+            fmt = 'png'
+            img.save(buf, format='PNG', optimize=True)
+
+        # Already-small files (e.g. paletted PNGs) can grow when resampled: keep the original bytes at the thumbnail size
+        if src_format in _PASSTHROUGH_FORMATS and src_size <= buf.tell():
+            return img.size[0], img.size[1], _PASSTHROUGH_FORMATS[src_format], _read_b64(file_path)
+        return img.size[0], img.size[1], f"image/{fmt}", base64.b64encode(buf.getvalue()).decode("utf-8")
+
+def get_preview_data(file_path: str, mode: str = 'svg', settings: Optional[Dict[str, Any]] = None):
     """
     Parallel-friendly function that returns picklable data for a preview.
     mode: 'svg' or 'html'
+    settings: the theme's [preview] section
     """
+    settings = resolve_preview_settings(settings)
     try:
         if mode == 'html':
-            return get_html_preview(file_path)
+            return get_html_preview(file_path, settings)
         
         # SVG Mode: Return structured data
         mime_type, _ = mimetypes.guess_type(file_path)
         ext = os.path.splitext(file_path)[1].lower()
         file_size = os.path.getsize(file_path)
 
-        # 1. Image (No size limit)
+        # 1. Image (thumbnailed to the preview box)
         if mime_type and (mime_type.startswith('image/') or ext in ('.jxl', '.webp')):
             try:
-                with Image.open(file_path) as img:
-                    w, h = img.size
-                return {
-                    'type': 'image',
-                    'width': w,
-                    'height': h,
-                    'data': _read_b64(file_path),
-                    'mime': mime_type or "image/png"
-                }
+                thumb = make_thumbnail(file_path, settings)
+                if thumb:
+                    w, h, thumb_mime, data = thumb
+                    return {
+                        'type': 'image',
+                        'width': w,
+                        'height': h,
+                        'data': data,
+                        'mime': thumb_mime
+                    }
             except:
                 pass
 
-        # 2. Size Check for other types
-        if file_size > MAX_PREVIEW_SIZE:
+        # 2. Size Check for other types (text is read through a bounded window)
+        if file_size > MAX_PREVIEW_SIZE and not settings['max_lines']:
             return {'type': 'placeholder', 'text': f"Large {mime_type or 'File'}", 'width': 150, 'height': 30}
 
         # 3. Media Placeholder
@@ -142,42 +333,29 @@ def get_preview_data(file_path: str, mode: str = 'svg'):
             return {'type': 'placeholder', 'text': "Binary File", 'width': 120, 'height': 30}
 
         # 5. Code/Text
-        code = _read_text_preview(file_path)
+        code, note = _read_text_window(file_path, settings)
         if not code:
             return None
 
+        from pygments.lexers import get_lexer_for_filename, TextLexer
         try:
             lexer = get_lexer_for_filename(file_path)
         except:
             lexer = TextLexer()
 
-        style = get_style_by_name('monokai')
+        colors = _token_colors(settings['style'])
         try:
-            tokens = list(lexer.get_tokens(code))
+            render_lines = _token_lines(lexer.get_tokens(code), colors)
         except:
-            tokens = list(TextLexer().get_tokens(code))
+            render_lines = _token_lines(TextLexer().get_tokens(code), colors)
 
-        token_lines = _get_token_lines(tokens)
-        
-        # Prepare structured lines
-        render_lines = []
-        max_w = 0
-        for row in token_lines:
-            line_parts = []
-            line_w = 0
-            for ttype, value in row:
-                clean_val = sanitize_text(value)
-                try:
-                    style_dict = style.style_for_token(ttype)
-                    color = '#' + (style_dict['color'] or 'abb2bf')
-                except:
-                    color = '#abb2bf'
-                
-                line_parts.append((color, clean_val))
-                line_w += len(clean_val) * (CODE_FONT_SIZE * 0.72)
-            
-            render_lines.append(line_parts)
-            max_w = max(max_w, line_w)
+        # Monospace: a line is as wide as its character count
+        char_w = CODE_FONT_SIZE * 0.72
+        max_w = max((sum(len(val) for _, val in line) for line in render_lines), default=0) * char_w
+
+        if note:
+            render_lines.append([(TRUNCATION_COLOR, note)])
+            max_w = max(max_w, len(note) * char_w)
 
         return {
             'type': 'code',
@@ -189,14 +367,19 @@ def get_preview_data(file_path: str, mode: str = 'svg'):
     except Exception as e:
         return {'type': 'placeholder', 'text': f"Error: {sanitize_text(str(e))}", 'width': 200, 'height': 30}
 
-def get_html_preview(file_path: str) -> str:
+def get_html_preview(file_path: str, settings: Optional[Dict[str, Any]] = None) -> str:
+    settings = resolve_preview_settings(settings)
     mime_type, _ = mimetypes.guess_type(file_path)
     ext = os.path.splitext(file_path)[1].lower()
     try:
         file_size = os.path.getsize(file_path)
         if mime_type and (mime_type.startswith('image/') or ext in ('.jxl', '.webp')):
-            # No size limit for images here either
-            data = _read_b64(file_path)
+            # Raster images are thumbnailed; anything Pillow can't read (e.g. SVG) is embedded as-is
+            thumb = make_thumbnail(file_path, settings)
+            if thumb:
+                _, _, mime_type, data = thumb
+            else:
+                data = _read_b64(file_path)
             if not mime_type: mime_type = "image/png"
             return f'<div class="preview-image"><img src="data:{mime_type};base64,{data}" style="max-width: 100%; border-radius: 5px;"></div>'
         
@@ -214,47 +397,78 @@ def get_html_preview(file_path: str) -> str:
         elif is_binary(file_path):
             return f'<div class="preview-error">Binary File ({file_size} bytes)</div>'
         
-        code = _read_text_preview(file_path)
+        code, note = _read_text_window(file_path, settings)
         if not code: return ""
+        from pygments import highlight
+        from pygments.lexers import get_lexer_for_filename, TextLexer
+        from pygments.formatters import HtmlFormatter
         try: lexer = get_lexer_for_filename(file_path)
         except: lexer = TextLexer()
-        formatter = HtmlFormatter(style='monokai', noclasses=True, wrapcode=True)
-        return f'<div class="preview-code">{highlight(code, lexer, formatter)}</div>'
+        formatter = HtmlFormatter(style=_token_colors(settings['style']).style, noclasses=True, wrapcode=True)
+        truncated = f'<div class="preview-truncated">{html.escape(note)}</div>' if note else ""
+        return f'<div class="preview-code">{highlight(code, lexer, formatter)}{truncated}</div>'
     except Exception as e:
         return f'<div class="preview-error">Error: {html.escape(str(e))}</div>'
 
-def build_svg_preview_from_data(data: dict) -> svgwrite.container.Group:
-    """Reconstructs an SVG Group from pre-calculated data."""
-    group = svgwrite.container.Group()
+def preview_text(data: Optional[dict]) -> str:
+    """The text `write_svg_preview` writes for `data`."""
     if not data:
-        return group
+        return ""
+    if data['type'] == 'placeholder':
+        return data['text']
+    if data['type'] == 'code':
+        return "".join(val for line in data['lines'] for _, val in line)
+    return ""
+
+def write_svg_preview(w, data: dict, compact: bool = False):
+    """
+    Emits the preview panel for pre-calculated data into an SVG writer. `compact` (the
+    optimized SVG mode) takes the panel styles from the `.pc`/`.pb` CSS classes and leaves the
+    most common color of the code runs to the group.
+    """
+    if not data:
+        return
 
     box_w, box_h = data['width'], data['height']
     
     # Background
-    if data['type'] == 'code':
-        bg = svgwrite.shapes.Rect(size=(box_w, box_h), fill="#282c34", stroke="#3e4451", rx=5, ry=5)
+    if compact:
+        w.add('rect', x=0, y=0, width=box_w, height=box_h, rx=5 if data['type'] == 'code' else 4, class_="pc" if data['type'] == 'code' else "pb")
+    elif data['type'] == 'code':
+        w.add('rect', x=0, y=0, width=box_w, height=box_h, fill="#282c34", stroke="#3e4451", rx=5, ry=5)
     else:
-        bg = svgwrite.shapes.Rect(size=(box_w, box_h), fill="#21252b", stroke="#3e4451", rx=4, ry=4)
-    group.add(bg)
+        w.add('rect', x=0, y=0, width=box_w, height=box_h, fill="#21252b", stroke="#3e4451", rx=4, ry=4)
 
     if data['type'] == 'placeholder':
-        txt = svgwrite.text.Text(data['text'], insert=(10, 18), fill="#abb2bf", font_family="monospace", font_size=12)
-        group.add(txt)
+        w.add('text', data['text'], x=10, y=18, fill="#abb2bf", font_family="monospace", font_size=12)
     
     elif data['type'] == 'image':
         uri = f"data:{data['mime']};base64,{data['data']}"
-        img_node = svgwrite.image.Image(href=uri, insert=(10, 10), size=(data['width']-20, data['height']-20))
-        group.add(img_node)
+        w.add('image', href=uri, x=10, y=10, width=data['width']-20, height=data['height']-20)
         
+    elif data['type'] == 'code' and compact:
+        # The font attributes are left out: the document's `text` rule overrides them anyway
+        lines = data['lines']
+        counts = Counter(color for line in lines for color, _ in line)
+        default = counts.most_common(1)[0][0] if counts else None
+        w.start('g', fill=default)
+        y = LINE_HEIGHT
+        for line in lines:
+            w.start('text', x=10, y=y, **{'xml:space': 'preserve'})
+            for color, val in line:
+                if color == default:
+                    w.text(val)
+                else:
+                    w.add('tspan', val, fill=color)
+            w.end()
+            y += LINE_HEIGHT
+        w.end()
+
     elif data['type'] == 'code':
         y = LINE_HEIGHT
         for line in data['lines']:
-            text_elem = svgwrite.text.Text("", insert=(10, y), font_family="monospace", font_size=CODE_FONT_SIZE)
-            text_elem['xml:space'] = 'preserve'
+            w.start('text', x=10, y=y, font_family="monospace", font_size=CODE_FONT_SIZE, **{'xml:space': 'preserve'})
             for color, val in line:
-                text_elem.add(svgwrite.text.TSpan(val, fill=color))
-            group.add(text_elem)
+                w.add('tspan', val, fill=color)
+            w.end()
             y += LINE_HEIGHT
-            
-    return group
\ No newline at end of file
@@ -0,0 +1,170 @@
+import os
+import time
+import heapq
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, List, Optional
+
+class Profiler:
+    """
+    Run statistics for `--profile`: wall/CPU time, counters and traced peak memory per stage,
+    plus per-type preview counts and the slowest previews. Stages nest; a stage's `self` time
+    excludes the stages entered inside it. CPU time and memory cover this process only,
+    preview extraction in the pool workers is reported through `preview`.
+    """
+
+    def __init__(self, slowest: int = 10, trace_memory: bool = True):
+        self.slowest = slowest
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.preview_types: Dict[str, int] = {}
+        self.preview_seconds = 0.0
+        self.preview_cached = 0
+        self._slow: List[tuple] = []
+        self._stack: List[List[Any]] = []
+        self._wall, self._cpu = time.perf_counter(), time.process_time()
+        self._peak = 0
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _stage(self, name: str) -> Dict[str, Any]:
+        if name not in self.stages:
+            self.stages[name] = {'depth': len(self._stack), 'calls': 0, 'wall': 0.0, 'self': 0.0, 'cpu': 0.0,
+                                 'items': 0, 'bytes_read': 0, 'bytes_written': 0, 'peak': 0}
+        return self.stages[name]
+
+    def _traced_peak(self) -> int:
+        # The tracemalloc peak is reset at every stage boundary, so it is folded into the enclosing stage first
+        if not self.trace_memory:
+            return 0
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        self._peak = max(self._peak, peak)
+        return peak
+
+    @contextmanager
+    def stage(self, name: str):
+        stats = self._stage(name)
+        if self._stack:
+            self._stack[-1][3] = max(self._stack[-1][3], self._traced_peak())
+        else:
+            self._traced_peak()
+        frame = [name, time.perf_counter(), time.process_time(), 0, 0.0]  # name, wall, cpu, peak, child wall
+        self._stack.append(frame)
+        try:
+            yield stats
+        finally:
+            self._stack.pop()
+            wall = time.perf_counter() - frame[1]
+            stats['calls'] += 1
+            stats['wall'] += wall
+            stats['self'] += wall - frame[4]
+            stats['cpu'] += time.process_time() - frame[2]
+            peak = max(frame[3], self._traced_peak())
+            stats['peak'] = max(stats['peak'], peak)
+            if self._stack:
+                self._stack[-1][3] = max(self._stack[-1][3], peak)
+                self._stack[-1][4] += wall
+
+    def add(self, name: str, items: int = 0, bytes_read: int = 0, bytes_written: int = 0):
+        stats = self._stage(name)
+        stats['items'] += items
+        stats['bytes_read'] += bytes_read
+        stats['bytes_written'] += bytes_written
+
+    def preview(self, path: str, kind: str, seconds: Optional[float], size: int = 0):
+        """Records one preview; `seconds` is the worker's extraction time, None for a cache hit."""
+        self.preview_types[kind] = self.preview_types.get(kind, 0) + 1
+        self.add('previews', items=1, bytes_read=size)
+        if seconds is None:
+            self.preview_cached += 1
+            return
+        self.preview_seconds += seconds
+        entry = (seconds, path, kind, size)
+        if len(self._slow) < self.slowest:
+            heapq.heappush(self._slow, entry)
+        elif self.slowest and entry > self._slow[0]:
+            heapq.heapreplace(self._slow, entry)
+
+    def report(self) -> Dict[str, Any]:
+        self._traced_peak()
+        return {
+            'wall': time.perf_counter() - self._wall,
+            'cpu': time.process_time() - self._cpu,
+            'peak_memory': self._peak if self.trace_memory else None,
+            'stages': {name: dict(stats) for name, stats in self.stages.items()},
+            'previews': {'count': sum(self.preview_types.values()), 'cached': self.preview_cached,
+                         'worker_seconds': self.preview_seconds, 'by_type': dict(sorted(self.preview_types.items()))},
+            'slowest_previews': [{'path': path, 'type': kind, 'seconds': seconds, 'bytes': size}
+                                 for seconds, path, kind, size in sorted(self._slow, reverse=True)],
+        }
+
+def _format_bytes(n: Optional[int]) -> str:
+    if not n:
+        return "-"
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+def format_report(report: Dict[str, Any]) -> str:
+    peak = f", peak memory {_format_bytes(report['peak_memory'])}" if report['peak_memory'] is not None else ""
+    lines = [f"Profile: {report['wall']:.3f} s wall, {report['cpu']:.3f} s CPU{peak}",
+             f"  {'stage':<18} {'wall':>9} {'self':>9} {'cpu':>9} {'items':>8} {'read':>10} {'written':>10} {'peak mem':>10}"]
+    for name, s in report['stages'].items():
+        label = "  " * s['depth'] + name + (f" x{s['calls']}" if s['calls'] > 1 else "")
+        # Counter-only stages (e.g. previews, timed in the workers) have no times of their own
+        times = f"{s['wall']:>8.3f}s {s['self']:>8.3f}s {s['cpu']:>8.3f}s" if s['calls'] else f"{'-':>9} {'-':>9} {'-':>9}"
+        lines.append(f"  {label:<18} {times} {s['items'] or '-':>8} "
+                     f"{_format_bytes(s['bytes_read']):>10} {_format_bytes(s['bytes_written']):>10} {_format_bytes(s['peak']):>10}")
+    p = report['previews']
+    if p['count']:
+        kinds = ", ".join(f"{kind} {n}" for kind, n in p['by_type'].items())
+        lines.append(f"Previews: {p['count']} ({kinds}), {p['cached']} from cache, {p['worker_seconds']:.3f} s in workers")
+    if report['slowest_previews']:
+        lines.append("Slowest previews:")
+        for e in report['slowest_previews']:
+            lines.append(f"  {e['seconds']:>8.3f}s  {e['type']:<12} {_format_bytes(e['bytes']):>10}  {e['path']}")
+    return "\n".join(lines)
+
+def preview_kind(value: Any) -> str:
+    """Type of a preview result: the `type` of SVG preview data, the panel class of HTML previews."""
+    if isinstance(value, dict):
+        return value.get('type', 'unknown')
+    if isinstance(value, str):
+        if not value:
+            return 'empty'
+        start = value.find('class="preview-')
+        if start >= 0:
+            start += len('class="preview-')
+            return value[start:value.find('"', start)]
+    return 'none' if value is None else 'unknown'
+
+_PROFILER: Optional[Profiler] = None
+
+def start_profiler(slowest: int = 10, trace_memory: bool = True) -> Profiler:
+    global _PROFILER
+    _PROFILER = Profiler(slowest, trace_memory)
+    return _PROFILER
+
+def get_profiler() -> Optional[Profiler]:
+    return _PROFILER
+
+def stage(name: str):
+    """`with stage('scan'):` times the block when profiling is on and does nothing otherwise."""
+    return _PROFILER.stage(name) if _PROFILER else nullcontext()
+
+def count(name: str, items: int = 0, bytes_read: int = 0, bytes_written: int = 0):
+    if _PROFILER:
+        _PROFILER.add(name, items, bytes_read, bytes_written)
+
+def output_size(target: Any) -> int:
+    """Size of a written output: a path or an in-memory buffer."""
+    if isinstance(target, str):
+        try:
+            return os.path.getsize(target)
+        except OSError:
+            return 0
+    getbuffer = getattr(target, 'getbuffer', None)
+    return getbuffer().nbytes if getbuffer else 0
@@ -1,16 +1,79 @@
+import io
 import os
-import base64
-import mimetypes
-import svgwrite
+import html
 import pathspec
-from typing import List, Dict, Any, Optional, Tuple, Callable
-from fontTools.ttLib import TTFont
-from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, BinaryIO, List, Optional, Callable, Tuple, Union
 
-from .core import TreeEntry, flatten_tree
-from .icons import get_font_path, ensure_font_exists, get_glyph_path, get_icon_and_color
-from .export import export_png
-from .preview import get_preview_data, build_svg_preview_from_data, sanitize_text
+from .core import TreeEntry, TreeStore, flatten_tree
+from .fonts import font_face_rule
+from .icons import load_glyph_paths, get_icon_and_color
+from .preview import write_svg_preview, preview_text, sanitize_text
+from .pool import get_preview_pool
+from .profiling import stage
+from .writer import SvgStreamWriter, SvgDomWriter, compact_number
+
+# Trees with at least this many rows are streamed to disk instead of built as an svgwrite DOM
+STREAM_MIN_ROWS = 2000
+
+class _Connectors:
+    """
+    Tree lines of the optimized SVG mode, as absolute path data: a vertical line that continues
+    through consecutive rows is one segment, emitted when it ends, and segments are written in
+    batches of FLUSH_SEGMENTS per `path` element.
+    """
+    FLUSH_SEGMENTS = 4096
+
+    def __init__(self, w, x_start: float, indent_unit: float, rel_y: float):
+        self.w, self.x_start, self.indent_unit, self.rel_y = w, x_start, indent_unit, rel_y
+        self.runs: Dict[int, float] = {}  # column depth -> y where its open vertical run started
+        self.segments: List[str] = []
+        self.dashed: List[str] = []
+
+    def column(self, depth: int) -> float:
+        return self.x_start + (depth * self.indent_unit) + (self.indent_unit / 2) - 4
+
+    def x(self, depth: int) -> str:
+        return compact_number(self.column(depth))
+
+    def _vertical(self, depth: int, y1: float, y2: float):
+        self.segments.append(f"M{self.x(depth)} {compact_number(y1)}V{compact_number(y2)}")
+        if len(self.segments) >= self.FLUSH_SEGMENTS:
+            self.flush()
+
+    def row(self, y: float, depth: int, parent_is_last: List[bool], is_last: bool, elbow: bool = True):
+        """Lines of the row at `y`: the ancestors' verticals, its own column (down to the elbow if last) and the elbow."""
+        full = {d for d, was_last in enumerate(parent_is_last) if not was_last}
+        if not (is_last and elbow):
+            full.add(depth)
+        # Runs that don't cross this row end at its top, except its own column, which reaches the elbow
+        drawn = False
+        for d in [d for d in self.runs if d not in full]:
+            start = self.runs.pop(d)
+            drawn = drawn or d == depth
+            self._vertical(d, start, y + self.rel_y if d == depth else y)
+        if depth not in full and not drawn:
+            self._vertical(depth, y, y + self.rel_y)
+        for d in full:
+            self.runs.setdefault(d, y)
+        if elbow:
+            self.segments.append(f"M{self.x(depth)} {compact_number(y + self.rel_y)}h12")
+
+    def preview(self, x: float, y1: float, y2: float, x2: float):
+        self.dashed.append(f"M{compact_number(x)} {compact_number(y1)}V{compact_number(y2)}H{compact_number(x2)}")
+
+    def flush(self):
+        if self.segments:
+            self.w.add('path', d="".join(self.segments), class_="l")
+            self.segments = []
+        if self.dashed:
+            self.w.add('path', d="".join(self.dashed), class_="pl")
+            self.dashed = []
+
+    def close(self, y: float):
+        for d, start in self.runs.items():
+            self._vertical(d, start, y)
+        self.runs = {}
+        self.flush()
 
 def parse_font_weight(thickness: str) -> str:
     thickness = str(thickness).lower()
@@ -21,14 +84,67 @@ def parse_font_weight(thickness: str) -> str:
     }
     return mapping.get(thickness, thickness)
 
-def generate_svg(root_path: str, output_path: str, tree_nodes: List[TreeEntry], theme: Dict[str, Any], save_png: bool = False, png_scale: int = 1, preview_patterns: Optional[str] = None, on_progress: Optional[Callable[[], None]] = None):
-    ensure_font_exists()
-    font_path = get_font_path()
+def plan_pages(tree_nodes: TreeStore, page_rows: int, split_by: str = 'rows') -> List[int]:
+    """
+    Returns the first row of every page. Pages hold at most `page_rows` rows; with
+    split_by='subtree' a page also ends early rather than splitting a top-level subtree
+    that would fit on the next page.
+    """
+    starts, count = [0], 0
+    for i in range(len(tree_nodes)):
+        if count and (count >= page_rows or (split_by == 'subtree' and tree_nodes.parents[i] < 0 and count + tree_nodes.ends[i] - i > page_rows)):
+            starts.append(i)
+            count = 0
+        count += 1
+    return starts
+
+def page_path(output_path: str, page: int, count: int) -> str:
+    """`tree.svg` -> `tree-07.svg`, numbered from 1 and padded to the page count."""
+    stem, ext = os.path.splitext(output_path)
+    return f"{stem}-{page:0{len(str(count))}d}{ext}"
+
+def write_page_index(index_path: str, title: str, pages: List[Tuple[str, str]], background: str = '#282c34'):
+    """Writes an HTML page linking (and stacking, so they stitch) the given (path, label) pages."""
+    links, images = [], []
+    for k, (path, label) in enumerate(pages, 1):
+        href = html.escape(os.path.relpath(path, os.path.dirname(os.path.abspath(index_path))))
+        links.append(f'<li><a href="#page-{k}">Page {k}</a> <a href="{href}">{html.escape(os.path.basename(path))}</a> {html.escape(label)}</li>')
+        images.append(f'<img id="page-{k}" src="{href}" loading="lazy" style="display: block;">')
+    with open(index_path, "w", encoding="utf-8") as f:
+        f.write(f'<!DOCTYPE html><html><head><meta charset="UTF-8"><title>Tree: {html.escape(title)}</title></head>'
+                f'<body style="background-color: {background}; color: #abb2bf; font-family: monospace;"><h3>{html.escape(title)}</h3><ol>{"".join(links)}</ol>{"".join(images)}</body></html>')
+
+def generate_svg(root_path: str, output_path: Union[str, BinaryIO], tree_nodes: TreeStore, theme: Dict[str, Any], save_png: bool = False, png_scale: int = 1, preview_patterns: Optional[str] = None, on_progress: Optional[Callable[[], None]] = None, backend: str = 'auto', preview_cache=None, page_rows: int = 0, split_by: str = 'rows', on_page: Optional[Callable[[int, int, str, str], None]] = None, row_cache: Optional[Dict[tuple, bytes]] = None, optimize: bool = False, font_flavor: Optional[str] = None) -> List[Tuple[str, str]]:
+    """
+    Renders the tree to `output_path`, or, when `page_rows` is set and the tree needs more
+    than one page, to numbered pages next to it (see `plan_pages` and `page_path`). Each
+    page is closed and passed to `on_page(page, page_count, path, label)` before the next
+    one is laid out. Returns the (path, label) of every file written.
+
+    `output_path` may also be a binary stream; pages then go to fresh `io.BytesIO` buffers,
+    which take the place of their paths above.
+
+    `row_cache` (kept by the caller between renders of the same theme, e.g. in watch mode)
+    maps a row's name, flags, depth and tree lines to its streamed markup, so unchanged rows
+    without a preview are copied instead of re-serialized. It ends up holding this render's rows.
+
+    A custom font (`font.path` in the theme) is embedded in each page subset to the characters
+    the page shows, in `font_flavor` (see `fonts.subset_font`): by default WOFF2 for browsers,
+    or a TrueType/OpenType subset when `save_png` is set, since the rasterizers don't read WOFF.
+    Callers rasterizing the pages themselves pass 'sfnt'. Its @font-face rule is written at
+    the end of the page, once all the text is known.
+
+    `optimize` writes smaller markup that is faster to parse and rasterize (always streamed, no
+    row cache): rows at absolute positions instead of in translated groups, all tree lines
+    merged into a few paths (see `_Connectors`), repeated styles as CSS classes, code
+    colors grouped and numbers trimmed to two decimals. A `.svgz` output path is gzipped either way.
+    """
     try:
-        font = TTFont(font_path)
+        with stage('glyphs'):
+            glyphs = load_glyph_paths()
     except Exception as e:
-        print(f"Could not load font from {font_path}: {e}")
-        return
+        print(f"Could not load icon glyphs: {e}")
+        return []
 
     # Extract Theme Variables
     layout = theme.get('layout', {})
@@ -45,120 +161,258 @@ def generate_svg(root_path: str, output_path: str, tree_nodes: List[TreeEntry],
         preview_spec = pathspec.PathSpec.from_lines('gitwildmatch', patterns)
 
     # --- Parallel Preview Pass ---
-    visual_rows = list(flatten_tree(tree_nodes))
-    preview_tasks = []
-    for node in visual_rows:
-        if not node.is_dir and preview_spec and (preview_spec.match_file(node.name) or preview_spec.match_file(node.path)):
-            preview_tasks.append((node.path, 'svg'))
-        else:
-            preview_tasks.append(None)
+    to_process = []
+    for i, node in enumerate(flatten_tree(tree_nodes)):
+        if not node.is_dir and not node.is_more and preview_spec and (preview_spec.match_file(node.name) or preview_spec.match_file(node.path)):
+            to_process.append((i, node.path))
 
-    preview_results = [None] * len(visual_rows)
-    to_process = [(i, task[0], task[1]) for i, task in enumerate(preview_tasks) if task]
-    
-    if to_process:
-        with ProcessPoolExecutor() as executor:
-            futures = [executor.submit(get_preview_data, path, mode) for _, path, mode in to_process]
-            for (idx, _, _), future in zip(to_process, futures):
-                if on_progress: on_progress()
-                preview_results[idx] = future.result()
+    starts = plan_pages(tree_nodes, page_rows, split_by) if page_rows > 0 else [0]
+    paged = len(starts) > 1
 
-    # --- Pre-calculation Pass ---
-    render_plan: List[Tuple[TreeEntry, Any, float, float]] = [] 
-    max_len = 0
     root_name = os.path.basename(os.path.abspath(root_path)) or root_path
-    max_len = max(max_len, len(root_name) * 10 + 30)
-    
-    for i, node in enumerate(visual_rows):
-        data = preview_results[i]
-        preview_group, extra_h, extra_w = None, 0, 0
-        if data:
-            try:
-                preview_group = build_svg_preview_from_data(data)
-                extra_h = float(data['height']) + 10
-                extra_w = float(data['width']) + 40
-            except Exception as e:
-                print(f"Preview fail for {node.name}: {e}")
-        
-        render_plan.append((node, preview_group, extra_h, extra_w))
-        row_content_width = (node.depth + 1) * indent_unit + 30 + (len(node.name) * 11) + extra_w
-        max_len = max(max_len, row_content_width)
-            
-    total_height = sum(row_height + p[2] for p in render_plan) + row_height + (padding * 2)
-    total_width = max_len + (padding * 2) + 60
-    dwg = svgwrite.Drawing(output_path, size=(total_width, total_height), profile='full')
-    
-    # Background and Styles
-    bg_color = colors_cfg.get('background', '#282c34')
-    dwg.add(dwg.rect(insert=(0, 0), size=('100%', '100%'), fill=bg_color))
-    
+
+    # Styles
     family, f_type, thickness = font_cfg.get('family', 'monospace'), font_cfg.get('type', ''), font_cfg.get('thickness', 'Regular')
     custom_font_path, css_weight = font_cfg.get('path'), parse_font_weight(thickness)
     font_stack = f'"{family} {f_type}", "{family}", monospace' if f_type else f'"{family}", monospace'
     css_family_name = f"{family} {f_type}" if f_type else family
 
-    font_face_rule = ""
-    if custom_font_path and os.path.exists(custom_font_path):
-        try:
-            mime_type, _ = mimetypes.guess_type(custom_font_path)
-            if not mime_type: mime_type = "font/ttf"
-            with open(custom_font_path, "rb") as f:
-                b64_data = base64.b64encode(f.read()).decode('utf-8')
-            font_face_rule = f"@font-face {{ font-family: \"{css_family_name}\"; src: url(\"data:{mime_type};base64,{b64_data}\") format(\"truetype\"); font-weight: {css_weight}; font-style: normal; }}" 
-        except: pass
+    embed_font = custom_font_path if custom_font_path and os.path.exists(custom_font_path) else None
+    font_flavor = font_flavor or ('sfnt' if save_png else 'web')
+    used_chars = set()
 
     line_color = colors_cfg.get('lines', '#5c6370')
     text_file_color, text_folder_color = colors_cfg.get('text_file', '#abb2bf'), colors_cfg.get('text_folder', '#61afef')
-    dwg.defs.add(dwg.style(f"{font_face_rule}\ntext {{ font-family: {font_stack}; font-size: {font_size}px; font-weight: {css_weight}; dominant-baseline: middle; }}\n.folder {{ font-weight: bold; fill: {text_folder_color}; }}\n.file {{ fill: {text_file_color}; }}"))
-    
-    # Pre-define all needed icons in <defs>
-    all_icons_needed = {get_icon_and_color(root_name, True, theme)[0]}
-    for node, _, _, _ in render_plan: all_icons_needed.add(get_icon_and_color(node.name, node.is_dir, theme)[0])
+    css = f"text {{ font-family: {font_stack}; font-size: {font_size}px; font-weight: {css_weight}; dominant-baseline: middle; }}\n.folder {{ font-weight: bold; fill: {text_folder_color}; }}\n.file {{ fill: {text_file_color}; }}"
+    if paged:
+        css += f"\n.continued {{ fill: {line_color}; font-style: italic; }}"
+
+    root_icon_char, root_color = get_icon_and_color(root_name, True, theme)
+    all_icons_needed, folded = {root_icon_char}, False
+    # Optimized mode: icon fills become one CSS class per color
+    icon_classes: Dict[str, str] = {root_color: "i0"}
+    for node in flatten_tree(tree_nodes):
+        if node.is_more:
+            folded = True
+            continue
+        icon_char, color = get_icon_and_color(node.name, node.is_dir, theme)
+        all_icons_needed.add(icon_char)
+        if optimize and color not in icon_classes: icon_classes[color] = f"i{len(icon_classes)}"
+    if folded:
+        css += f"\n.more {{ fill: {text_file_color}; font-style: italic; opacity: 0.6; }}"
+    if optimize:
+        css += (f"\n.l {{ fill: none; stroke: {line_color}; stroke-width: 1; }}\n.pl {{ fill: none; stroke: {line_color}; stroke-width: 1; stroke-dasharray: 2,2; }}"
+                "\n.pc { fill: #282c34; stroke: #3e4451; }\n.pb { fill: #21252b; stroke: #3e4451; }"
+                + "".join(f"\n.{cls} {{ fill: {color}; }}" for color, cls in icon_classes.items()))
     
     def get_icon_id(char): return f"icon-{ord(char)}"
-    for icon_char in all_icons_needed:
-        symbol = dwg.symbol(id=get_icon_id(icon_char), viewBox="0 0 2048 2048")
-        symbol.add(dwg.path(d=get_glyph_path(font, icon_char), transform="scale(1, -1) translate(0, -1700)"))
-        dwg.defs.add(symbol)
+    bg_color = colors_cfg.get('background', '#282c34')
+    x_start, rel_y = padding, row_height / 2
 
-    # --- Drawing ---
-    x_start, current_y_top = padding, padding
-    root_icon_char, root_color = get_icon_and_color(root_name, True, theme)
-    root_grp, rel_y = dwg.g(transform=f"translate(0, {current_y_top})"), row_height / 2
-    root_grp.add(dwg.use(href=f"#{get_icon_id(root_icon_char)}", insert=(x_start, rel_y - 8), size=(16, 16), fill=root_color))
-    root_grp.add(dwg.text(sanitize_text(root_name), insert=(x_start + 24, rel_y), class_="folder"))
-    dwg.add(root_grp)
-    current_y_top += row_height
-
-    for node, preview_group, extra_h, _ in render_plan:
-        if on_progress: on_progress()
-        row_h = row_height + extra_h
-        row_grp, rel_y = dwg.g(transform=f"translate(0, {current_y_top})"), row_height / 2
+    w, max_len, total_height, current_y_top, page_target, connectors = None, 0, 0, 0, None, None
+    written: List[Tuple[str, str]] = []
+
+    def open_page(page: int):
+        nonlocal w, max_len, total_height, current_y_top, page_target, connectors
+        first = starts[page]
+        rows = (starts[page + 1] if page + 1 < len(starts) else len(tree_nodes)) - first
+        page_backend = 'stream' if optimize else backend
+        if page_backend == 'auto':
+            page_backend = 'stream' if rows >= STREAM_MIN_ROWS else 'svgwrite'
+        if not paged:
+            path = output_path
+        elif isinstance(output_path, str):
+            path = page_path(output_path, page + 1, len(starts))
+        else:
+            path = io.BytesIO()
+        page_target = path
+        w = SvgDomWriter(path) if page_backend == 'svgwrite' else SvgStreamWriter(path, compact=optimize)
+        connectors = _Connectors(w, x_start, indent_unit, rel_y) if optimize else None
+        max_len = len(root_name) * 10 + 30
+        total_height = row_height + (padding * 2)
+        used_chars.clear()
+
+        w.begin()
+        w.start('defs')
+        w.style(css)
+        # Pre-define all needed icons in <defs>
+        for icon_char in all_icons_needed:
+            w.start('symbol', id=get_icon_id(icon_char), viewBox="0 0 2048 2048")
+            w.add('path', d=glyphs.get(icon_char, ""), transform="scale(1, -1) translate(0, -1700)")
+            w.end()
+        w.end()
+
+        # Background
+        w.add('rect', x=0, y=0, width='100%', height='100%', fill=bg_color)
+
+        current_y_top = padding
+        if page == 0:
+            used_chars.update(root_name)
+        if page == 0 and optimize:
+            w.add('use', href=f"#{get_icon_id(root_icon_char)}", x=x_start, y=current_y_top + rel_y - 8, width=16, height=16, class_=icon_classes[root_color])
+            w.add('text', sanitize_text(root_name), x=x_start + 24, y=current_y_top + rel_y, class_="folder")
+        elif page == 0:
+            w.start('g', transform=f"translate(0, {current_y_top})")
+            w.add('use', href=f"#{get_icon_id(root_icon_char)}", x=x_start, y=rel_y - 8, width=16, height=16, fill=root_color)
+            w.add('text', sanitize_text(root_name), x=x_start + 24, y=rel_y, class_="folder")
+            w.end()
+        else:
+            parent = tree_nodes.parents[first]
+            where = os.path.relpath(tree_nodes.path(parent), root_path) if parent >= 0 else ""
+            continuation(first, f"{os.path.join(root_name, where) if where else root_name} (continued from page {page})")
+        current_y_top += row_height
+
+    def continuation(row: int, text: str):
+        # Marker row carrying the tree lines that cross the page break, so pages stitch visually
+        nonlocal max_len
+        node = TreeEntry(tree_nodes, row)
+        used_chars.update(f"\u22ee {text}")
+        max_len = max(max_len, (node.depth + 1) * indent_unit + 30 + len(text) * 11)
+        if optimize:
+            connectors.row(current_y_top, node.depth, node.parent_is_last, False, elbow=False)
+            w.add('text', sanitize_text(f"\u22ee {text}"), x=connectors.column(node.depth) + 18, y=current_y_top + rel_y, class_="continued")
+            return
+        w.start('g', transform=f"translate(0, {current_y_top})")
         for d, was_last in enumerate(node.parent_is_last):
             if not was_last:
                 line_x = x_start + (d * indent_unit) + (indent_unit / 2) - 4
-                row_grp.add(dwg.line(start=(line_x, 0), end=(line_x, row_h), stroke=line_color, stroke_width=1))
-        
+                w.add('line', x1=line_x, y1=0, x2=line_x, y2=row_height, stroke=line_color, stroke_width=1)
         cur_x = x_start + (node.depth * indent_unit) + (indent_unit / 2) - 4
-        row_grp.add(dwg.line(start=(cur_x, rel_y), end=(cur_x + 12, rel_y), stroke=line_color, stroke_width=1))
-        row_grp.add(dwg.line(start=(cur_x, 0), end=(cur_x, rel_y), stroke=line_color, stroke_width=1))
-        if not node.is_last_child: row_grp.add(dwg.line(start=(cur_x, rel_y), end=(cur_x, row_h), stroke=line_color, stroke_width=1))
+        w.add('line', x1=cur_x, y1=0, x2=cur_x, y2=row_height, stroke=line_color, stroke_width=1)
+        w.add('text', sanitize_text(f"\u22ee {text}"), x=cur_x + 18, y=rel_y, class_="continued")
+        w.end()
 
-        icon_x = cur_x + 18
-        icon_char, color = get_icon_and_color(node.name, node.is_dir, theme)
-        row_grp.add(dwg.use(href=f"#{get_icon_id(icon_char)}", insert=(icon_x, rel_y - 8), size=(16, 16), fill=color))
-        row_grp.add(dwg.text(sanitize_text(node.name), insert=(icon_x + 24, rel_y), class_="folder" if node.is_dir else "file"))
-        
-        if preview_group:
-            preview_x, preview_y = icon_x + 48, row_height
-            container = dwg.g(transform=f"translate({preview_x}, {preview_y})")
-            container.add(preview_group)
-            row_grp.add(dwg.path(d=f"M {icon_x + 34} {rel_y + 10} L {icon_x + 34} {preview_y + 10} L {preview_x} {preview_y + 10}", stroke=line_color, fill="none", stroke_width=1, stroke_dasharray="2,2"))
-            row_grp.add(container)
-        
-        dwg.add(row_grp)
-        current_y_top += row_h
-        
-    dwg.save()
+    def close_page(page: int):
+        nonlocal total_height
+        if page + 1 < len(starts):
+            continuation(starts[page + 1], f"continued on page {page + 2}")
+            total_height += row_height
+        if connectors:
+            connectors.close(current_y_top + row_height if page + 1 < len(starts) else current_y_top)
+        font_face = font_face_rule(embed_font, css_family_name, css_weight, used_chars, font_flavor) if embed_font else ""
+        if font_face:
+            # CSS applies to the whole document wherever the rule appears
+            w.start('defs')
+            w.style(font_face)
+            w.end()
+        total_width = max_len + (padding * 2) + 60
+        w.close(total_width, total_height)
+
+        first = starts[page]
+        last = (starts[page + 1] if page + 1 < len(starts) else len(tree_nodes)) - 1
+        label = f"{os.path.relpath(tree_nodes.path(first), root_path)} \u2026 {os.path.relpath(tree_nodes.path(last), root_path)}" if last >= first else ""
+        written.append((page_target, label))
+        if on_page: on_page(page + 1, len(starts), page_target, label)
+
+    # --- Drawing ---
+    # Rows are written as soon as their preview is ready; the document size is filled in at the end.
+    previews = get_preview_pool().schedule(to_process, 'svg', preview_cache, theme.get('preview'))
+    fresh_rows = {} if row_cache is not None else None
+    try:
+        page = 0
+        open_page(page)
+
+        for i, node in enumerate(flatten_tree(tree_nodes)):
+            if page + 1 < len(starts) and i == starts[page + 1]:
+                close_page(page)
+                page += 1
+                open_page(page)
+
+            data, extra_h, extra_w = None, 0, 0
+            if i in previews:
+                if on_progress: on_progress()
+                data = previews.get(i)
+            if data:
+                try:
+                    extra_h = float(data['height']) + 10
+                    extra_w = float(data['width']) + 40
+                except Exception as e:
+                    print(f"Preview fail for {node.name}: {e}")
+                    data = None
+
+            if embed_font:
+                used_chars.update(node.name)
+                used_chars.update(preview_text(data))
+
+            row_content_width = (node.depth + 1) * indent_unit + 30 + (len(node.name) * 11) + extra_w
+            max_len = max(max_len, row_content_width)
+
+            if on_progress: on_progress()
+            row_h = row_height + extra_h
+            parent_is_last = node.parent_is_last
+            if optimize:
+                y = current_y_top + rel_y
+                connectors.row(current_y_top, node.depth, parent_is_last, node.is_last_child)
+                icon_x = connectors.column(node.depth) + 18
+                if node.is_more:
+                    w.add('text', sanitize_text(node.name), x=icon_x, y=y, class_="more")
+                else:
+                    icon_char, color = get_icon_and_color(node.name, node.is_dir, theme)
+                    w.add('use', href=f"#{get_icon_id(icon_char)}", x=icon_x, y=y - 8, width=16, height=16, class_=icon_classes[color])
+                    w.add('text', sanitize_text(node.name), x=icon_x + 24, y=y, class_="folder" if node.is_dir else "file")
+                if data:
+                    preview_x, preview_y = icon_x + 48, current_y_top + row_height
+                    connectors.preview(icon_x + 34, y + 10, preview_y + 10, preview_x)
+                    w.start('g', transform=f"translate({compact_number(preview_x)}, {compact_number(preview_y)})")
+                    write_svg_preview(w, data, compact=True)
+                    w.end()
+                current_y_top += row_h
+                total_height += row_h
+                continue
+
+            row_key = (node.name, tree_nodes.flags[i], node.depth, tuple(parent_is_last)) if fresh_rows is not None and not data and isinstance(w, SvgStreamWriter) else None
+            cached = row_cache.get(row_key) if row_key else None
+            if cached is not None:
+                # Same markup as w.start('g', ...) / w.end(), minus the attribute formatting
+                w.raw(f'<g transform="translate(0, {current_y_top})">'.encode('utf-8') + cached + b'</g>')
+                fresh_rows[row_key] = cached
+                current_y_top += row_h
+                total_height += row_h
+                continue
+
+            w.start('g', transform=f"translate(0, {current_y_top})")
+            if row_key: w.begin_fragment()
+
+            for d, was_last in enumerate(parent_is_last):
+                if not was_last:
+                    line_x = x_start + (d * indent_unit) + (indent_unit / 2) - 4
+                    w.add('line', x1=line_x, y1=0, x2=line_x, y2=row_h, stroke=line_color, stroke_width=1)
+            
+            cur_x = x_start + (node.depth * indent_unit) + (indent_unit / 2) - 4
+            w.add('line', x1=cur_x, y1=rel_y, x2=cur_x + 12, y2=rel_y, stroke=line_color, stroke_width=1)
+            w.add('line', x1=cur_x, y1=0, x2=cur_x, y2=rel_y, stroke=line_color, stroke_width=1)
+            if not node.is_last_child: w.add('line', x1=cur_x, y1=rel_y, x2=cur_x, y2=row_h, stroke=line_color, stroke_width=1)
+
+            icon_x = cur_x + 18
+            if node.is_more:
+                w.add('text', sanitize_text(node.name), x=icon_x, y=rel_y, class_="more")
+            else:
+                icon_char, color = get_icon_and_color(node.name, node.is_dir, theme)
+                w.add('use', href=f"#{get_icon_id(icon_char)}", x=icon_x, y=rel_y - 8, width=16, height=16, fill=color)
+                w.add('text', sanitize_text(node.name), x=icon_x + 24, y=rel_y, class_="folder" if node.is_dir else "file")
+            if row_key: fresh_rows[row_key] = w.end_fragment()
+            
+            if data:
+                preview_x, preview_y = icon_x + 48, row_height
+                w.add('path', d=f"M {icon_x + 34} {rel_y + 10} L {icon_x + 34} {preview_y + 10} L {preview_x} {preview_y + 10}", stroke=line_color, fill="none", stroke_width=1, stroke_dasharray="2,2")
+                w.start('g', transform=f"translate({preview_x}, {preview_y})")
+                w.start('g')
+                write_svg_preview(w, data)
+                w.end()
+                w.end()
+            
+            w.end()
+            current_y_top += row_h
+            total_height += row_h
+    finally:
+        previews.close()
+
+    close_page(page)
+    if row_cache is not None:
+        row_cache.clear()
+        row_cache.update(fresh_rows)
     if save_png:
-        export_png(output_path, os.path.splitext(output_path)[0] + ".png", png_scale)
+        from .export import export_png
+        for path, _ in written:
+            if isinstance(path, str): export_png(path, os.path.splitext(path)[0] + ".png", png_scale, batch=len(written) > 1)
+    return written
@@ -0,0 +1,144 @@
+import io
+import sys
+import gzip
+import json
+import time
+from array import array
+from itertools import accumulate
+from typing import Any, BinaryIO, Dict, Optional
+
+from .core import TreeStore
+
+SNAPSHOT_FORMAT = "svgtree-snapshot"
+SNAPSHOT_VERSION = 1
+BINARY_MAGIC = b"SVGTREE\0"
+GZIP_MAGIC = b"\x1f\x8b"
+# Files with these extensions (optionally followed by .gz) are written in the binary format
+BINARY_EXTENSIONS = ('.svgtree', '.bin')
+# Entries per NDJSON line: large enough that json.loads, not a Python loop, does the parsing
+NDJSON_CHUNK = 8192
+# Binary column order, each as raw little-endian items of the TreeStore array type
+_COLUMNS = (('name_offsets', 'I'), ('parents', 'i'), ('depths', 'H'), ('flags', 'B'), ('ends', 'i'))
+
+def _header(store: TreeStore, meta: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    return {'format': SNAPSHOT_FORMAT, 'version': SNAPSHOT_VERSION, 'root': store.root_path,
+            'entries': len(store), 'created': int(time.time()), **(meta or {})}
+
+def _check_header(header: Dict[str, Any]) -> Dict[str, Any]:
+    if header.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError("not an svgtree snapshot")
+    if header.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"unsupported snapshot version {header.get('version')} (expected {SNAPSHOT_VERSION})")
+    return header
+
+def _le(values: array) -> array:
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+def write_snapshot(store: TreeStore, path: str, meta: Optional[Dict[str, Any]] = None, binary: Optional[bool] = None) -> int:
+    """
+    Writes `store` to `path` and returns the bytes written. The format follows the extension:
+    binary for BINARY_EXTENSIONS, NDJSON otherwise; a trailing `.gz` gzips either. `meta`
+    (e.g. the scan depth and excludes) is stored in the header.
+    """
+    stem = path[:-3] if path.endswith('.gz') else path
+    if binary is None:
+        binary = stem.endswith(BINARY_EXTENSIONS)
+    header = _header(store, meta)
+    raw = open(path, 'wb')
+    f: BinaryIO = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) if path.endswith('.gz') else raw
+    try:
+        if binary:
+            names = store.name_buffer().encode('utf-8')
+            header['names_bytes'] = len(names)
+            header['columns'] = [[name, code, array(code).itemsize] for name, code in _COLUMNS]
+            header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+            f.write(BINARY_MAGIC + len(header_bytes).to_bytes(4, 'little') + header_bytes)
+            for name, _ in _COLUMNS:
+                f.write(_le(getattr(store, name)).tobytes())
+            f.write(names)
+        else:
+            # Header line, then columnar chunks: {"n": names, "d": depths, "f": flags}.
+            # Parents and subtree ends follow from the pre-order depths and are rebuilt on load.
+            w = io.TextIOWrapper(f, encoding='utf-8', newline='\n', write_through=True)
+            w.write(json.dumps(header, separators=(',', ':'), ensure_ascii=False) + "\n")
+            for start in range(0, len(store), NDJSON_CHUNK):
+                end = min(start + NDJSON_CHUNK, len(store))
+                chunk = {'n': [store.name(i) for i in range(start, end)],
+                         'd': store.depths[start:end].tolist(), 'f': store.flags[start:end].tolist()}
+                w.write(json.dumps(chunk, separators=(',', ':'), ensure_ascii=False) + "\n")
+            w.detach()
+    finally:
+        if f is not raw:
+            f.close()
+        size = raw.tell()
+        raw.close()
+    return size
+
+def _read_binary(f: BinaryIO) -> TreeStore:
+    header = _check_header(json.loads(f.read(int.from_bytes(f.read(4), 'little')).decode('utf-8')))
+    count = header['entries']
+    columns = {}
+    for (name, code), (_, stored_code, itemsize) in zip(_COLUMNS, header['columns']):
+        values = array(code)
+        if stored_code != code or itemsize != values.itemsize:
+            raise ValueError(f"snapshot column {name} has type {stored_code}/{itemsize}, expected {code}/{values.itemsize}")
+        n = count + 1 if name == 'name_offsets' else count
+        data = f.read(n * itemsize)
+        if len(data) != n * itemsize:
+            raise ValueError("snapshot is truncated")
+        values.frombytes(data)
+        columns[name] = _le(values)
+    names = f.read(header['names_bytes']).decode('utf-8')
+    if len(names) != columns['name_offsets'][-1]:
+        raise ValueError("snapshot is truncated")
+    return TreeStore.from_columns(header['root'], names, **columns)
+
+def _read_ndjson(f: BinaryIO) -> TreeStore:
+    lines = io.TextIOWrapper(f, encoding='utf-8')
+    header = _check_header(json.loads(lines.readline()))
+    names, depths, flags = [], array('H'), array('B')
+    for line in lines:
+        if line.strip():
+            chunk = json.loads(line)
+            names.extend(chunk['n'])
+            depths.extend(chunk['d'])
+            flags.extend(chunk['f'])
+    count = len(names)
+    if count != header['entries'] or len(depths) != count or len(flags) != count:
+        raise ValueError("snapshot is truncated")
+
+    name_offsets = array('I', [0])
+    name_offsets.extend(accumulate(map(len, names)))
+    parents, ends = array('i', [-1]) * count, array('i', [count]) * count
+    # Pre-order: an entry's parent is the nearest open entry one level up; a subtree ends
+    # where an entry at the same or a shallower depth starts
+    base = depths[0] if count else 0
+    stack = []
+    for i, depth in enumerate(depths):
+        level = depth - base
+        while len(stack) > level:
+            ends[stack.pop()] = i
+        if stack:
+            parents[i] = stack[-1]
+        stack.append(i)
+    return TreeStore.from_columns(header['root'], "".join(names), name_offsets, parents, depths, flags, ends)
+
+def read_snapshot(path: str) -> TreeStore:
+    """Loads a snapshot written by `write_snapshot`; the format and compression are detected."""
+    raw = open(path, 'rb')
+    compressed = raw.peek(2)[:2] == GZIP_MAGIC
+    f: BinaryIO = gzip.GzipFile(fileobj=raw, mode='rb') if compressed else raw
+    try:
+        if f.peek(len(BINARY_MAGIC))[:len(BINARY_MAGIC)] == BINARY_MAGIC:
+            f.read(len(BINARY_MAGIC))
+            return _read_binary(f)
+        return _read_ndjson(f)
+    except (KeyError, TypeError, UnicodeDecodeError, json.JSONDecodeError, EOFError, OSError) as e:
+        raise ValueError(f"invalid snapshot: {e}") from e
+    finally:
+        if f is not raw:
+            f.close()
+        raw.close()
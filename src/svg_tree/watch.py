@@ -0,0 +1,361 @@
+import os
+import time
+import errno
+import select
+import struct
+import threading
+import pathspec
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from .cache import MISS
+from .core import Listing, TreeStore, build_tree, flatten_tree, list_dir
+from .ignore import IGNORE_FILES, IgnoreRules
+
+# Quiet time that ends a burst of events, and the longest a burst may delay a render
+DEFAULT_DEBOUNCE = 0.2
+MAX_DEBOUNCE = 2.0
+DEFAULT_POLL_INTERVAL = 1.0
+
+class ListingCache:
+    """
+    In-memory directory listings for `build_tree` (same `listing` protocol as `cache.ScanCache`)
+    that stay valid until the watcher reports a change. The first scan may be served by
+    `backing`, e.g. a persistent ScanCache.
+    """
+
+    def __init__(self, backing=None):
+        self.backing = backing
+        self.dirs: Dict[str, Listing] = {}
+        self.used: Dict[str, Listing] = {}
+        self._lock = threading.Lock()
+
+    def listing(self, path: str, ignore: Optional[IgnoreRules], max_entries: int = 0) -> Listing:
+        listing = self.dirs.get(path)
+        if listing is None:
+            listing = self.backing.listing(path, ignore, max_entries) if self.backing else list_dir(path, ignore, max_entries)
+        with self._lock:
+            self.used[path] = listing
+        return listing
+
+    def commit(self):
+        """Keeps only the listings the last scan used (directories that left the tree are dropped)."""
+        self.dirs, self.used = self.used, {}
+
+    def refresh(self, path: str, ignore: Optional[IgnoreRules], max_entries: int = 0) -> bool:
+        """Re-reads one directory; returns whether its visible listing changed."""
+        if path not in self.dirs:
+            return False
+        if not os.path.isdir(path):
+            # Removed or replaced; its parent's listing reports the change
+            del self.dirs[path]
+            return True
+        listing = list_dir(path, ignore, max_entries)
+        if listing == self.dirs[path]:
+            return False
+        self.dirs[path] = listing
+        return True
+
+class MemoryPreviewCache:
+    """
+    Keeps preview results in memory between renders (same `find`/`load`/`get`/`put` protocol
+    as `cache.PreviewCache`), validated against the file's size and mtime. Misses fall through
+    to `backing`, a persistent PreviewCache, when there is one.
+    """
+
+    def __init__(self, backing=None):
+        self.backing = backing
+        self.entries: Dict[Tuple[str, str], Tuple[Tuple[int, int, int], Any]] = {}
+
+    @property
+    def needs_stamps(self) -> bool:
+        return bool(self.backing and self.backing.needs_stamps)
+
+    @staticmethod
+    def _stamp(path: str) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_size, st.st_mtime_ns, st.st_ino)
+
+    def find(self, path: str, settings_key: str):
+        stamp = self._stamp(path)
+        entry = self.entries.get((path, settings_key))
+        if stamp and entry and entry[0] == stamp:
+            return (path, settings_key, None)
+        if self.backing:
+            key = self.backing.find(path, settings_key)
+            if key is not None:
+                return (path, settings_key, key)
+        return None
+
+    def load(self, found):
+        path, settings_key, key = found
+        if key is None:
+            entry = self.entries.get((path, settings_key))
+            return entry[1] if entry else MISS
+        value = self.backing.load(key)
+        stamp = self._stamp(path)
+        if value is not MISS and stamp:
+            self.entries[(path, settings_key)] = (stamp, value)
+        return value
+
+    def get(self, path: str, settings_key: str):
+        found = self.find(path, settings_key)
+        return MISS if found is None else self.load(found)
+
+    def put(self, path: str, settings_key: str, result, file=None):
+        stamp = self._stamp(path)
+        if stamp:
+            self.entries[(path, settings_key)] = (stamp, result)
+        if self.backing:
+            self.backing.put(path, settings_key, result, file)
+
+    def prune(self, paths: Set[str]):
+        """Drops the previews of files that are no longer previewed."""
+        for key in [k for k in self.entries if k[0] not in paths]:
+            del self.entries[key]
+
+    def close(self):
+        if self.backing:
+            self.backing.close()
+
+def preview_targets(tree_nodes: TreeStore, preview_patterns: Optional[str]) -> Set[str]:
+    """Paths of the files the renderers preview (matched by name or path, as they do)."""
+    if not preview_patterns:
+        return set()
+    spec = pathspec.PathSpec.from_lines('gitwildmatch', [p.strip() for p in preview_patterns.split(",")])
+    targets = set()
+    for node in flatten_tree(tree_nodes):
+        if not node.is_dir and not node.is_more and (spec.match_file(node.name) or spec.match_file(node.path)):
+            targets.add(node.path)
+    return targets
+
+# Changed directories (whose listing may differ) and changed file paths
+Changes = Tuple[Set[str], Set[str]]
+
+class InotifyWatcher:
+    """
+    Watches the scanned directories with inotify (through ctypes, Linux only). Raises
+    OSError when inotify is unavailable or the watch limit is reached.
+    """
+    IN_MODIFY = 0x2
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_MOVE_SELF = 0x800
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ONLYDIR = 0x1000000
+    ENTRY_EVENTS = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | ENTRY_EVENTS | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+    _EVENT = struct.Struct('iIII')
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+        if not hasattr(os, 'O_NONBLOCK'):
+            raise OSError(errno.ENOSYS, "inotify is not available on this platform")
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, "inotify is not available on this platform")
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._ctypes = ctypes
+        self._wd_paths: Dict[int, str] = {}
+        self._path_wds: Dict[str, int] = {}
+        self._dirs: Set[str] = set()
+        self._targets: Set[str] = set()
+
+    def sync(self, dirs: Iterable[str], targets: Set[str]):
+        """Watches exactly `dirs`; `targets` are the files whose content matters."""
+        dirs = set(dirs)
+        for path in [p for p in self._path_wds if p not in dirs]:
+            self._libc.inotify_rm_watch(self.fd, self._path_wds.pop(path))
+        for path in dirs - self._path_wds.keys():
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+            if wd < 0:
+                err = self._ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    raise OSError(err, "inotify watch limit reached (see fs.inotify.max_user_watches)")
+                continue  # Vanished since the scan; its parent's events cover it
+            self._wd_paths[wd] = path
+            self._path_wds[path] = wd
+        self._dirs, self._targets = dirs, targets
+
+    def _read(self, timeout: Optional[float], changes: Changes) -> bool:
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return False
+        try:
+            buf = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return False
+        dirs, files = changes
+        offset = 0
+        while offset + self._EVENT.size <= len(buf):
+            wd, mask, _, length = self._EVENT.unpack_from(buf, offset)
+            name = buf[offset + self._EVENT.size:offset + self._EVENT.size + length].rstrip(b'\0')
+            offset += self._EVENT.size + length
+            if mask & self.IN_Q_OVERFLOW:
+                # Events were lost: treat everything as changed
+                dirs.update(self._dirs)
+                files.update(self._targets)
+                continue
+            path = self._wd_paths.get(wd)
+            if path is None:
+                continue
+            if mask & self.IN_IGNORED:
+                self._path_wds.pop(self._wd_paths.pop(wd), None)
+                continue
+            if mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF):
+                dirs.add(path)
+                continue
+            child = os.path.join(path, os.fsdecode(name)) if name else path
+            if mask & self.ENTRY_EVENTS:
+                dirs.add(path)
+            files.add(child)
+        return True
+
+    def wait(self, debounce: float) -> Changes:
+        """Blocks until something changes, then collects events until `debounce` seconds pass quietly."""
+        changes: Changes = (set(), set())
+        self._read(None, changes)
+        deadline = time.monotonic() + MAX_DEBOUNCE
+        while time.monotonic() < deadline and self._read(min(debounce, max(0.0, deadline - time.monotonic())), changes):
+            pass
+        return changes
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    """
+    Fallback watcher: stats the scanned directories (whose mtime changes when entries are
+    added, removed or renamed) and the previewed files every `interval` seconds.
+    """
+
+    def __init__(self, interval: float = DEFAULT_POLL_INTERVAL):
+        self.interval = interval
+        self._stamps: Dict[str, Optional[Tuple[int, int, int]]] = {}
+        self._dirs: Set[str] = set()
+
+    @property
+    def needs_stamps(self) -> bool:
+        return bool(self.backing and self.backing.needs_stamps)
+
+    @staticmethod
+    def _stamp(path: str) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def sync(self, dirs: Iterable[str], targets: Set[str]):
+        self._dirs = set(dirs)
+        self._stamps = {path: self._stamp(path) for path in self._dirs | targets}
+
+    def _poll(self, changes: Changes) -> bool:
+        found = False
+        for path, old in self._stamps.items():
+            new = self._stamp(path)
+            if new != old:
+                self._stamps[path] = new
+                (changes[0] if path in self._dirs else changes[1]).add(path)
+                found = True
+        return found
+
+    def wait(self, debounce: float) -> Changes:
+        changes: Changes = (set(), set())
+        while not self._poll(changes):
+            time.sleep(self.interval)
+        deadline = time.monotonic() + MAX_DEBOUNCE
+        while time.monotonic() < deadline:
+            time.sleep(debounce)
+            if not self._poll(changes):
+                break
+        return changes
+
+    def close(self):
+        pass
+
+def make_watcher(poll_interval: Optional[float] = None):
+    """inotify when available, polling otherwise (or when `poll_interval` is given)."""
+    if poll_interval is None:
+        try:
+            return InotifyWatcher()
+        except OSError as e:
+            print(f"inotify unavailable ({e}), polling every {DEFAULT_POLL_INTERVAL:g}s instead")
+            poll_interval = DEFAULT_POLL_INTERVAL
+    return PollingWatcher(poll_interval)
+
+def watch(
+    root_path: str,
+    max_depth: int,
+    ignore: Optional[IgnoreRules],
+    tree_nodes: TreeStore,
+    listings: ListingCache,
+    render: Callable[[TreeStore], None],
+    preview_patterns: Optional[str] = None,
+    preview_cache: Optional[MemoryPreviewCache] = None,
+    jobs: int = 1,
+    debounce: float = DEFAULT_DEBOUNCE,
+    poll_interval: Optional[float] = None,
+    max_entries: int = 0
+):
+    """
+    Re-renders `tree_nodes` whenever the tree changes, until interrupted. Only the directories
+    named by the watcher are re-read (everything else comes from `listings`), only changed
+    previews are re-extracted (`preview_cache`), and changes that cannot alter the output,
+    such as edits to files that are not previewed, do not trigger a render at all.
+    """
+    listings.commit()
+    targets = preview_targets(tree_nodes, preview_patterns)
+
+    def sync(watcher):
+        # Ignore files are watched like previews: editing one can change what is listed
+        watched = targets | set(ignore.files()) if ignore else targets
+        try:
+            watcher.sync(listings.dirs, watched)
+            return watcher
+        except OSError as e:
+            print(f"{e}, polling every {DEFAULT_POLL_INTERVAL:g}s instead")
+            watcher.close()
+            watcher = PollingWatcher(DEFAULT_POLL_INTERVAL)
+            watcher.sync(listings.dirs, watched)
+            return watcher
+
+    watcher = sync(make_watcher(poll_interval))
+    print(f"Watching {root_path} for changes ({type(watcher).__name__.replace('Watcher', '').lower()}, Ctrl+C to stop)")
+
+    try:
+        while True:
+            dirs, files = watcher.wait(debounce)
+            start = time.perf_counter()
+            if ignore:
+                # New rules re-filter the directory they live in and everything below it
+                for path in dirs | {os.path.dirname(p) for p in files if os.path.basename(p) in IGNORE_FILES}:
+                    if ignore.refresh(path):
+                        dirs |= {d for d in listings.dirs if d == path or d.startswith(path + os.sep)}
+            changed_dirs = [path for path in dirs if listings.refresh(path, ignore, max_entries)]
+            changed_previews = files & targets
+            if not changed_dirs and not changed_previews:
+                continue
+
+            if changed_dirs:
+                tree_nodes = build_tree(root_path, max_depth, ignore, jobs=jobs, cache=listings, max_entries=max_entries)
+                listings.commit()
+                targets = preview_targets(tree_nodes, preview_patterns)
+                if preview_cache:
+                    preview_cache.prune(targets)
+            render(tree_nodes)
+            watcher = sync(watcher)
+            print(f"Re-rendered in {(time.perf_counter() - start) * 1000:.0f} ms ({len(changed_dirs)} directories, {len(changed_previews)} previews changed)")
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+    finally:
+        watcher.close()
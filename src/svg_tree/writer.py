@@ -0,0 +1,179 @@
+import io
+import gzip
+import shutil
+import tempfile
+from typing import Any, BinaryIO, Dict, List, Optional, Union
+from xml.sax.saxutils import escape
+
+SVG_NAMESPACES = 'xmlns="http://www.w3.org/2000/svg" xmlns:ev="http://www.w3.org/2001/xml-events" xmlns:xlink="http://www.w3.org/1999/xlink"'
+
+# Reserved space in the root tag for `height="..." width="..."`, patched once the layout is known
+_SIZE_SLOT = 64
+_ATTR_ENTITIES = {'"': '&quot;', '\n': '&#10;', '\r': '&#13;', '\t': '&#09;'}
+
+_ATTR_NAMES: Dict[str, str] = {}
+
+def _attr_name(key: str) -> str:
+    # Same keyword convention as svgwrite: class_ -> class, stroke_width -> stroke-width
+    name = _ATTR_NAMES.get(key)
+    if name is None:
+        name = _ATTR_NAMES[key] = 'xlink:href' if key == 'href' else key.rstrip('_').replace('_', '-')
+    return name
+
+def compact_number(value: float) -> str:
+    """`48.0` -> `48`, `12.3456` -> `12.35`: at most two decimals, no trailing zeros."""
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return f"{value:.2f}".rstrip('0').rstrip('.')
+
+def _format_attrs(attrs: Dict[str, Any], compact: bool = False) -> str:
+    items = []
+    # Sorted like svgwrite output unless compact, which also trims numbers
+    for key, value in (attrs.items() if compact else sorted(attrs.items(), key=lambda kv: _attr_name(kv[0]))):
+        if value is None:
+            continue
+        value = compact_number(value) if compact and isinstance(value, float) else str(value)
+        if value:
+            items.append(f' {_attr_name(key)}="{escape(value, _ATTR_ENTITIES)}"')
+    return "".join(items)
+
+def is_svgz(output: Any) -> bool:
+    return isinstance(output, str) and output.lower().endswith('.svgz')
+
+def _write_gzip(path: str, data: BinaryIO):
+    with gzip.open(path, 'wb', compresslevel=9) as f:
+        shutil.copyfileobj(data, f, 1 << 20)
+
+class SvgStreamWriter:
+    """
+    Writes SVG markup straight to the output file as elements are emitted, instead of
+    building a DOM first. The root size is written into a reserved slot at the end.
+    `output` is a path or a seekable binary stream, which is left open. A `.svgz` path is
+    written to a temporary file and gzipped into place on `close`. `compact` trims numbers
+    to two decimals and keeps attributes in call order.
+    """
+
+    def __init__(self, output: Union[str, BinaryIO], compact: bool = False):
+        self.path = output if is_svgz(output) else None
+        self.f: BinaryIO = tempfile.TemporaryFile() if self.path else open(output, 'wb') if isinstance(output, str) else output
+        self._owns_file = isinstance(output, str)
+        self.compact = compact
+        self._stack: List[str] = []
+        self._size_pos = 0
+        self._fragment: Optional[List[bytes]] = None
+
+    def _write(self, s: str):
+        data = s.encode('utf-8')
+        if self._fragment is not None:
+            self._fragment.append(data)
+        self.f.write(data)
+
+    def begin_fragment(self):
+        """Starts recording the markup written from here on (it is still written)."""
+        self._fragment = []
+
+    def end_fragment(self) -> bytes:
+        """Returns the markup written since `begin_fragment`, for replaying with `raw`."""
+        data, self._fragment = b"".join(self._fragment), None
+        return data
+
+    def raw(self, data: bytes):
+        self.f.write(data)
+
+    def begin(self):
+        self._write('<?xml version="1.0" encoding="utf-8" ?>\n<svg baseProfile="full" ')
+        self._size_pos = self.f.tell()
+        self._write(' ' * _SIZE_SLOT + f' version="1.1" {SVG_NAMESPACES}>')
+
+    def start(self, tag: str, **attrs):
+        self._write(f'<{tag}{_format_attrs(attrs, self.compact)}>')
+        self._stack.append(tag)
+
+    def end(self):
+        self._write(f'</{self._stack.pop()}>')
+
+    def add(self, tag: str, text: Optional[str] = None, **attrs):
+        if text:
+            self._write(f'<{tag}{_format_attrs(attrs, self.compact)}>{escape(text)}</{tag}>')
+        else:
+            self._write(f'<{tag}{_format_attrs(attrs, self.compact)} />')
+
+    def text(self, text: str):
+        """Character data inside the open element (e.g. between the tspans of a `text`)."""
+        self._write(escape(text))
+
+    def style(self, css: str):
+        self._write(f'<style type="text/css"><![CDATA[{css}]]></style>')
+
+    def close(self, width: float, height: float):
+        while self._stack:
+            self.end()
+        self._write('</svg>')
+        size = f'height="{compact_number(height)}" width="{compact_number(width)}"'.encode('utf-8')
+        if len(size) > _SIZE_SLOT:
+            raise ValueError(f"SVG size {size.decode('utf-8')} does not fit the {_SIZE_SLOT}-byte slot in the root tag")
+        self.f.seek(self._size_pos)
+        self.f.write(size.ljust(_SIZE_SLOT))
+        self.f.seek(0, io.SEEK_END)
+        if self.path:
+            self.f.seek(0)
+            _write_gzip(self.path, self.f)
+        if self._owns_file:
+            self.f.close()
+
+class SvgDomWriter:
+    """Same interface as `SvgStreamWriter`, backed by an in-memory svgwrite Drawing."""
+
+    def __init__(self, output: Union[str, BinaryIO]):
+        import svgwrite
+        self.output = output
+        self.dwg = svgwrite.Drawing(output if isinstance(output, str) else 'noname.svg', profile='full')
+        self._stack: List[Any] = [self.dwg]
+
+    def begin(self):
+        pass
+
+    def _create(self, tag: str, text: Optional[str], attrs: Dict[str, Any]):
+        attrs = dict(attrs)
+        factory = getattr(self.dwg, tag)
+        if tag in ('use', 'image'):
+            elem = factory(attrs.pop('href'))
+        elif tag == 'path':
+            elem = factory(attrs.pop('d'))
+        elif text is not None or tag in ('text', 'tspan'):
+            elem = factory(text or "")
+        else:
+            elem = factory()
+        elem.update(attrs)
+        return elem
+
+    def start(self, tag: str, **attrs):
+        elem = self.dwg.defs if tag == 'defs' else self._create(tag, None, attrs)
+        if elem is not self.dwg.defs:
+            self._stack[-1].add(elem)
+        self._stack.append(elem)
+
+    def end(self):
+        self._stack.pop()
+
+    def add(self, tag: str, text: Optional[str] = None, **attrs):
+        self._stack[-1].add(self._create(tag, text, attrs))
+
+    def text(self, text: str):
+        self._stack[-1].add(self.dwg.tspan(text))
+
+    def style(self, css: str):
+        self._stack[-1].add(self.dwg.style(css))
+
+    def close(self, width: float, height: float):
+        self.dwg['width'], self.dwg['height'] = width, height
+        if isinstance(self.output, str) and not is_svgz(self.output):
+            self.dwg.save()
+            return
+        text = io.StringIO()
+        self.dwg.write(text)
+        data = text.getvalue().encode('utf-8')
+        if is_svgz(self.output):
+            _write_gzip(self.output, io.BytesIO(data))
+        else:
+            self.output.write(data)